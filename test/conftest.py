@@ -0,0 +1,57 @@
+import json
+
+import httpx
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+
+@pytest.fixture
+def turn_config(tmp_path, monkeypatch):
+    config = {
+        "lines": {
+            "test_line": {
+                "token": "ABCD",
+                "template_namespace": "test_namespace",
+                "expiry": "Apr 2, 2100 1:16 PM",
+            }
+        }
+    }
+    (tmp_path / "turn_config.json").write_text(json.dumps(config))
+    monkeypatch.chdir(tmp_path)
+    return config
+
+
+@pytest.fixture
+def mock_client():
+    def client(handler):
+        return httpx.AsyncClient(
+            base_url="https://whatsapp.turn.io/v1",
+            transport=httpx.MockTransport(handler),
+        )
+
+    return client
+
+
+class MockAdapter(BaseAdapter):
+    def __init__(self, handler):
+        super().__init__()
+        self.handler = handler
+
+    def send(self, request, **kwargs):
+        status_code, headers, body = self.handler(request)
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers.update(headers)
+        response._content = json.dumps(body).encode()
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def mock_adapter():
+    return MockAdapter
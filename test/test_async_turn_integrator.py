@@ -0,0 +1,203 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import turnpy.async_turn_integrator as async_turn_integrator
+
+
+def test_send_template_message_bulk(turn_config, mock_client):
+    sent = []
+
+    def handler(request):
+        message_data = json.loads(request.content)
+        sent.append(message_data)
+        if message_data["to"] == "232761234567":
+            return httpx.Response(400, json={"errors": [{"title": "Bad number"}]})
+        return httpx.Response(200, json={"messages": [{"id": "gBEGkYiEB1VXAglK"}]})
+
+    recipients = (
+        {"msisdn": msisdn, "body_params": [msisdn]}
+        for msisdn in ["27821234567", "232761234567", "27831234567"]
+    )
+
+    async def run():
+        async with mock_client(handler) as client:
+            return {
+                msisdn: response.status_code
+                async for msisdn, response in async_turn_integrator.send_template_message_bulk(
+                    "test_line", "welcome", recipients, concurrency=2, client=client
+                )
+            }
+
+    outcomes = asyncio.run(run())
+
+    assert outcomes == {"27821234567": 200, "232761234567": 400, "27831234567": 200}
+    assert sent[0]["template"]["namespace"] == "test_namespace"
+    assert (
+        sent[0]["template"]["components"][0]["parameters"][0]["text"] == sent[0]["to"]
+    )
+
+
+def test_run_bulk_bounds_concurrency():
+    in_flight = 0
+    peak = 0
+
+    async def worker(item):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        if item == 3:
+            raise ValueError("failed")
+        return item * 2
+
+    async def run():
+        return [
+            outcome
+            async for outcome in async_turn_integrator._run_bulk(range(20), worker, 4)
+        ]
+
+    outcomes = dict(asyncio.run(run()))
+
+    assert peak == 4
+    assert isinstance(outcomes.pop(3), ValueError)
+    assert outcomes == {item: item * 2 for item in range(20) if item != 3}
+
+
+def test_start_journey_bulk_retries_rate_limited_requests(turn_config, mock_client):
+    attempts = {}
+
+    def handler(request):
+        msisdn = json.loads(request.content)["wa_id"]
+        attempts[msisdn] = attempts.get(msisdn, 0) + 1
+        assert request.url.path == "/v1/stacks/stack-uuid/start"
+        assert request.headers["Authorization"] == "Bearer ABCD"
+        if msisdn == "27821234567" and attempts[msisdn] == 1:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(201, json={"success": True})
+
+    msisdns = [f"2782123456{digit}" for digit in range(10)]
+
+    async def run():
+        async with mock_client(handler) as client:
+            return {
+                msisdn: response.status_code
+                async for msisdn, response in async_turn_integrator.start_journey_bulk(
+                    "stack-uuid", msisdns, "test_line", concurrency=3, client=client
+                )
+            }
+
+    assert asyncio.run(run()) == {msisdn: 201 for msisdn in msisdns}
+    assert attempts["27821234567"] == 2
+
+
+def test_release_claims_bulk(turn_config, mock_client):
+    claims = {
+        "27821234560": "journey-1-claim",
+        "27821234561": "journey-1-other",
+        "27821234562": "journey-2-claim",
+    }
+    released = []
+
+    def handler(request):
+        msisdn = request.url.path.split("/")[-2]
+        if request.method == "GET":
+            if msisdn == "27821234564":
+                return httpx.Response(500)
+            if msisdn not in claims:
+                return httpx.Response(404, json={"errors": ["No conversation claim"]})
+            return httpx.Response(200, json={"uuid": claims[msisdn]})
+
+        assert json.loads(request.content) == {"claim_uuid": claims[msisdn]}
+        released.append(msisdn)
+        return httpx.Response(200, json={"claim_uuid": claims[msisdn]})
+
+    msisdns = [f"2782123456{digit}" for digit in range(5)]
+
+    async def run():
+        async with mock_client(handler) as client:
+            return await async_turn_integrator.release_claims_bulk(
+                msisdns, "test_line", claim_uuid_prefix="journey-1", client=client
+            )
+
+    summary = asyncio.run(run())
+
+    assert sorted(summary["released"]) == ["27821234560", "27821234561"]
+    assert summary["skipped"] == ["27821234562"]
+    assert summary["unclaimed"] == ["27821234563"]
+    assert summary["failed"] == ["27821234564"]
+    assert sorted(released) == sorted(summary["released"])
+
+
+def test_drain_waits_for_in_flight_requests_and_flushes_buffers(
+    turn_config, mock_client, monkeypatch
+):
+    from turnpy.exceptions import ClientClosedError
+    from turnpy.profile_buffer import ProfileUpdateBuffer
+
+    turn_client = async_turn_integrator.AsyncTurnClient()
+    monkeypatch.setattr(async_turn_integrator, "turn_client", turn_client)
+    handled = []
+
+    async def handler(request):
+        await asyncio.sleep(0.05)
+        handled.append(request.method)
+        return httpx.Response(200, json={"messages": [{"id": "gBEGkYiEB1VXAglK"}]})
+
+    async def run():
+        async with mock_client(handler) as client:
+            buffer = ProfileUpdateBuffer("test_line", window=60, client=client)
+            buffer.update("27821234567", {"chat_per_week": "1"})
+
+            async with turn_client:
+                send = asyncio.ensure_future(
+                    async_turn_integrator.send_message(
+                        "test_line", {"to": "27821234567"}, client=client
+                    )
+                )
+                await asyncio.sleep(0.01)
+                report = await turn_client.drain(timeout=1.0)
+
+                with pytest.raises(ClientClosedError):
+                    await async_turn_integrator.send_message(
+                        "test_line", {}, client=client
+                    )
+                assert (await send).status_code == 200
+
+            # Closing the client does not undo the drain, entering it again does
+            with pytest.raises(ClientClosedError):
+                await async_turn_integrator.send_message("test_line", {}, client=client)
+            async with turn_client:
+                await async_turn_integrator.send_message(
+                    "test_line", {"to": "27821234567"}, client=client
+                )
+        return report
+
+    report = asyncio.run(run())
+
+    assert report == {"in_flight": 0, "unflushed": 0}
+    assert sorted(handled) == ["PATCH", "POST", "POST"]
+
+
+def test_drain_reports_requests_still_in_flight(turn_config, mock_client, monkeypatch):
+    turn_client = async_turn_integrator.AsyncTurnClient()
+    monkeypatch.setattr(async_turn_integrator, "turn_client", turn_client)
+
+    async def handler(request):
+        await asyncio.sleep(1)
+        return httpx.Response(200)
+
+    async def run():
+        async with mock_client(handler) as client:
+            send = asyncio.ensure_future(
+                async_turn_integrator.send_message("test_line", {}, client=client)
+            )
+            await asyncio.sleep(0.01)
+            report = await turn_client.drain(timeout=0.01)
+            send.cancel()
+            return report
+
+    assert asyncio.run(run()) == {"in_flight": 1, "unflushed": 0}
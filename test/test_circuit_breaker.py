@@ -0,0 +1,190 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import turnpy.async_turn_integrator as async_turn_integrator
+from turnpy.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+from turnpy.concurrency_limiter import AdaptiveConcurrencyLimiter
+
+KEY = ("test_line", "messages")
+
+
+def test_circuit_opens_on_failure_rate():
+    breaker = CircuitBreaker(failure_rate_threshold=0.5, minimum_requests=4)
+
+    for _ in range(2):
+        breaker.before_request(KEY)
+        breaker.record_success(KEY)
+    breaker.before_request(KEY)
+    breaker.record_failure(KEY)
+    assert breaker.state(KEY) == CLOSED
+
+    breaker.before_request(KEY)
+    breaker.record_failure(KEY)
+    assert breaker.state(KEY) == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(KEY)
+
+    # Other lines and endpoints are not affected
+    breaker.before_request(("test_line", "media"))
+
+
+def test_half_open_probe():
+    breaker = CircuitBreaker(minimum_requests=1, open_duration=0.01)
+    breaker.record_failure(KEY)
+    time.sleep(0.02)
+
+    breaker.before_request(KEY)
+    assert breaker.state(KEY) == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(KEY)
+    breaker.record_failure(KEY)
+    assert breaker.state(KEY) == OPEN
+
+    time.sleep(0.02)
+    breaker.before_request(KEY)
+    breaker.record_success(KEY)
+    assert breaker.state(KEY) == CLOSED
+
+
+def test_client_fails_fast_when_circuit_is_open(turn_config, mock_client, monkeypatch):
+    requests_sent = []
+
+    def handler(request):
+        requests_sent.append(request)
+        return httpx.Response(503)
+
+    breaker = CircuitBreaker(minimum_requests=2, open_duration=60)
+    monkeypatch.setattr(
+        async_turn_integrator,
+        "turn_client",
+        async_turn_integrator.AsyncTurnClient(circuit_breaker=breaker),
+    )
+
+    async def run():
+        async with mock_client(handler) as client:
+            for _ in range(2):
+                response = await async_turn_integrator.send_message(
+                    "test_line", {"to": "27821234567"}, client=client
+                )
+                assert response.status_code == 503
+            with pytest.raises(CircuitOpenError):
+                await async_turn_integrator.send_message(
+                    "test_line", {"to": "27821234567"}, client=client
+                )
+
+    asyncio.run(run())
+
+    assert len(requests_sent) == 2
+    assert breaker.state(("test_line", "messages")) == OPEN
+
+
+def test_lost_probes_are_given_back():
+    breaker = CircuitBreaker(minimum_requests=1, open_duration=0.05)
+    breaker.record_failure(KEY)
+    time.sleep(0.06)
+
+    breaker.before_request(KEY)
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_request(KEY)
+    assert error.value.retry_after <= 0.05
+
+    breaker.release_probe(KEY)
+    breaker.before_request(KEY)
+
+    # A probe that is never reported back is given up on
+    time.sleep(0.06)
+    breaker.before_request(KEY)
+    assert breaker.state(KEY) == HALF_OPEN
+
+
+def test_cancelled_probe_does_not_keep_the_circuit_open(
+    turn_config, mock_client, monkeypatch
+):
+    healthy = False
+
+    async def handler(request):
+        if not healthy:
+            return httpx.Response(503)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"messages": [{"id": "1"}]})
+
+    breaker = CircuitBreaker(minimum_requests=1, open_duration=0.01)
+    monkeypatch.setattr(
+        async_turn_integrator,
+        "turn_client",
+        async_turn_integrator.AsyncTurnClient(circuit_breaker=breaker),
+    )
+
+    async def run():
+        nonlocal healthy
+        async with mock_client(handler) as client:
+            await async_turn_integrator.send_message(
+                "test_line", {"to": "27821234567"}, client=client
+            )
+            assert breaker.state(("test_line", "messages")) == OPEN
+            await asyncio.sleep(0.02)
+
+            healthy = True
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    async_turn_integrator.send_message(
+                        "test_line", {"to": "27821234567"}, client=client
+                    ),
+                    0.001,
+                )
+            response = await async_turn_integrator.send_message(
+                "test_line", {"to": "27821234567"}, client=client
+            )
+            assert response.status_code == 200
+
+    asyncio.run(run())
+    assert breaker.state(("test_line", "messages")) == CLOSED
+
+
+def test_open_circuit_fails_fast_while_the_limiter_is_full(
+    turn_config, mock_client, monkeypatch
+):
+    async def handler(request):
+        await asyncio.sleep(0.5)
+        return httpx.Response(200, json={"fields": {}})
+
+    breaker = CircuitBreaker(minimum_requests=1, open_duration=60)
+    breaker.before_request(KEY)
+    breaker.record_failure(KEY)
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+    monkeypatch.setattr(
+        async_turn_integrator,
+        "turn_client",
+        async_turn_integrator.AsyncTurnClient(
+            circuit_breaker=breaker, concurrency_limiter=limiter
+        ),
+    )
+
+    async def run():
+        async with mock_client(handler) as client:
+            slow = asyncio.ensure_future(
+                async_turn_integrator.obtain_contact_profile(
+                    "27821234567", "test_line", client=client
+                )
+            )
+            await asyncio.sleep(0.01)
+            started = time.monotonic()
+            with pytest.raises(CircuitOpenError):
+                await async_turn_integrator.send_message(
+                    "test_line", {"to": "27821234567"}, client=client
+                )
+            assert time.monotonic() - started < 0.1
+            assert limiter.metrics()["test_line"]["waiting"] == 0
+            await slow
+
+    asyncio.run(run())
+    assert limiter.metrics()["test_line"]["in_flight"] == 0
@@ -0,0 +1,166 @@
+import asyncio
+import itertools
+import random
+
+import httpx
+import pytest
+
+import turnpy.async_turn_integrator as async_turn_integrator
+from turnpy.concurrency_limiter import AdaptiveConcurrencyLimiter
+
+
+def test_waits_for_a_free_slot():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2)
+
+    async def run():
+        first = await limiter.acquire("test_line")
+        await limiter.acquire("test_line")
+        waiting = asyncio.ensure_future(limiter.acquire("test_line"))
+        cancelled = asyncio.ensure_future(limiter.acquire("test_line"))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        assert limiter.metrics()["test_line"]["waiting"] == 2
+
+        cancelled.cancel()
+        limiter.release("test_line", first)
+        await waiting
+        await asyncio.gather(cancelled, return_exceptions=True)
+        assert limiter.metrics()["test_line"]["in_flight"] == 2
+        assert limiter.metrics()["test_line"]["waiting"] == 0
+
+        # Other lines have their own limit
+        await limiter.acquire("other_line")
+
+    asyncio.run(run())
+
+
+def test_additive_increase_and_multiplicative_decrease(monkeypatch):
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=8)
+    # Every response takes as long, so only the status codes matter
+    clock = itertools.count()
+    monkeypatch.setattr(
+        "turnpy.concurrency_limiter.time.monotonic", lambda: float(next(clock))
+    )
+
+    async def run():
+        for _ in range(40):
+            started = await limiter.acquire("test_line")
+            limiter.release("test_line", started, 200)
+        assert limiter.limit("test_line") == 8
+
+        # A burst of errors from requests in flight together only halves it once
+        starts = [await limiter.acquire("test_line") for _ in range(4)]
+        for started in starts:
+            limiter.release("test_line", started, 429)
+        assert limiter.limit("test_line") == 4
+
+        started = await limiter.acquire("test_line")
+        limiter.release("test_line", started, failed=True)
+        assert limiter.limit("test_line") == 2
+
+        # Requests that end without an outcome only free their slot
+        started = await limiter.acquire("test_line")
+        limiter.release("test_line", started)
+        assert limiter.limit("test_line") == 2
+        assert limiter.metrics()["test_line"]["in_flight"] == 0
+
+    asyncio.run(run())
+
+
+def test_invalid_limits():
+    with pytest.raises(ValueError):
+        AdaptiveConcurrencyLimiter(initial_limit=200, max_limit=100)
+
+
+def test_client_adapts_to_turn_capacity(turn_config, mock_client, monkeypatch):
+    capacity = 5
+    in_flight = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            await asyncio.sleep(0.001)
+            if in_flight > capacity:
+                return httpx.Response(429, headers={"Retry-After": "0"})
+            return httpx.Response(201, json={"success": True})
+        finally:
+            in_flight -= 1
+
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=40)
+    monkeypatch.setattr(
+        async_turn_integrator,
+        "turn_client",
+        async_turn_integrator.AsyncTurnClient(concurrency_limiter=limiter),
+    )
+
+    async def run():
+        async with mock_client(handler) as client:
+            return [
+                outcome
+                async for outcome in async_turn_integrator.start_journey_bulk(
+                    "stack-uuid",
+                    (f"2782{number:07}" for number in range(300)),
+                    "test_line",
+                    concurrency=40,
+                    client=client,
+                )
+            ]
+
+    outcomes = asyncio.run(run())
+    assert len(outcomes) == 300
+    assert limiter.limit("test_line") <= 2 * capacity
+    assert limiter.metrics()["test_line"]["in_flight"] == 0
+
+
+def test_latency_baseline_is_kept_per_endpoint(monkeypatch):
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4)
+    clock = [0.0]
+    monkeypatch.setattr("turnpy.concurrency_limiter.time.monotonic", lambda: clock[0])
+
+    async def call(endpoint, latency):
+        started = await limiter.acquire("test_line")
+        clock[0] += latency
+        limiter.release("test_line", started, 200, endpoint=endpoint)
+
+    async def run():
+        for _ in range(20):
+            await call("messages", 0.05)
+            await call("media", 2.0)
+        # A media upload is slow, but not slower than other media uploads
+        assert limiter.limit("test_line") > 4
+
+        limit = limiter.limit("test_line")
+        await call("messages", 2.0)
+        assert limiter.limit("test_line") == limit // 2
+
+    asyncio.run(run())
+    assert limiter.metrics()["test_line"]["baseline_latency"] == {
+        "messages": pytest.approx(0.05 + 1.95 / 21),
+        "media": pytest.approx(2.0),
+    }
+
+
+def test_latency_jitter_of_a_healthy_server_does_not_lower_the_limit(monkeypatch):
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=10)
+    latencies = random.Random(42)
+    clock = [0.0]
+    monkeypatch.setattr("turnpy.concurrency_limiter.time.monotonic", lambda: clock[0])
+
+    async def run():
+        for _ in range(200):
+            # Latency that does not depend on the load, with a long tail
+            started = clock[0]
+            in_flight = limiter.limit("test_line")
+            for _ in range(in_flight):
+                await limiter.acquire("test_line")
+            for latency in sorted(
+                latencies.lognormvariate(-3.0, 0.35) for _ in range(in_flight)
+            ):
+                clock[0] = started + latency
+                limiter.release("test_line", started, 200, endpoint="messages")
+                assert limiter.limit("test_line") >= 10
+
+    asyncio.run(run())
@@ -0,0 +1,126 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import turnpy.async_turn_integrator as async_turn_integrator
+from turnpy import core
+
+
+def test_build_requests():
+    request = core.release_claim_request("27821234567", "test_line", "ABCD", "uuid-1")
+    assert request == core.TurnRequest(
+        "test_line",
+        "DELETE",
+        "contacts/27821234567/claim",
+        "contacts/{msisdn}/claim",
+        {
+            "Authorization": "Bearer ABCD",
+            "Accept": "application/vnd.v1+json",
+            "Content-Type": "application/json",
+        },
+        b'{"claim_uuid":"uuid-1"}',
+    )
+
+    request = core.determine_claim_request("27821234567", "test_line", "ABCD")
+    assert request.body is None
+    assert "Content-Type" not in request.headers
+
+    request = core.save_media_request("test_line", "ABCD", "image/png", b"png")
+    assert request.headers == {
+        "Authorization": "Bearer ABCD",
+        "Content-Type": "image/png",
+    }
+    assert request.body == b"png"
+
+
+def test_message_payloads_are_encoded_once():
+    payload = core.encode_json({"to": "27821234567", "type": "text"})
+    request = core.send_message_request("test_line", "ABCD", payload)
+    assert request.body is payload
+    assert "Accept" not in request.headers
+
+    # The auth headers are cached per token
+    other = core.send_message_request("test_line", "ABCD", {"to": "27820000000"})
+    assert other.headers is request.headers
+    # and shared, so they cannot be changed by one request for all the others
+    with pytest.raises(TypeError):
+        other.headers["Authorization"] = "Bearer EFGH"
+
+
+def test_parse_claim():
+    claim = json.dumps({"uuid": "abc-123"}).encode()
+    assert core.parse_claim(404, b"") == ("unclaimed", None)
+    assert core.parse_claim(500, b"") == ("failed", None)
+    assert core.parse_claim(200, b"{}") == ("unclaimed", None)
+    assert core.parse_claim(200, claim) == ("release", "abc-123")
+    assert core.parse_claim(200, claim, "abc") == ("release", "abc-123")
+    assert core.parse_claim(200, claim, "xyz") == ("skipped", "abc-123")
+
+
+def test_retry_after():
+    assert core.retry_after({"Retry-After": "2"}) == 2.0
+    assert core.retry_after({"Retry-After": "soon"}) == 1.0
+    assert core.retry_after({}) == 1.0
+
+
+def test_circuit_outcome():
+    class Breaker:
+        def __init__(self):
+            self.calls = []
+
+        def __getattr__(self, name):
+            return lambda key: self.calls.append((name, key))
+
+    request = core.send_message_request("test_line", "ABCD", {})
+    breaker = Breaker()
+
+    for status_code in [200, 404, 503]:
+        with core.CircuitOutcome(breaker, request, OSError) as outcome:
+            outcome.response(status_code)
+    with pytest.raises(OSError):
+        with core.CircuitOutcome(breaker, request, OSError):
+            raise ConnectionError()
+    with pytest.raises(KeyboardInterrupt):
+        with core.CircuitOutcome(breaker, request, OSError):
+            raise KeyboardInterrupt()
+
+    key = ("test_line", "messages")
+    assert [name for name, call_key in breaker.calls if call_key == key] == [
+        "before_request",
+        "record_success",
+        "before_request",
+        "record_success",
+        "before_request",
+        "record_failure",
+        "before_request",
+        "record_failure",
+        "before_request",
+        "release_probe",
+    ]
+
+    # Without a circuit breaker it only lets the request through
+    with core.CircuitOutcome(None, request, OSError) as outcome:
+        outcome.response(503)
+
+
+def test_send_pre_encoded_message(turn_config, mock_client):
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        return httpx.Response(200, json={"messages": [{"id": "1"}]})
+
+    payload = core.encode_json({"to": "27821234567", "text": {"body": "hi"}})
+
+    async def run():
+        async with mock_client(handler) as client:
+            return await async_turn_integrator.send_message(
+                "test_line", payload, client=client
+            )
+
+    assert asyncio.run(run()).status_code == 200
+    assert sent[0].content == payload
+    assert sent[0].headers["Authorization"] == "Bearer ABCD"
+    assert sent[0].headers["Content-Type"] == "application/json"
@@ -0,0 +1,185 @@
+import json
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from turnpy.credentials import (
+    CachingCredentialProvider,
+    CredentialManager,
+    DictCredentialProvider,
+    EnvCredentialProvider,
+    FileCredentialProvider,
+    format_expiry,
+)
+
+
+def write_config(tmp_path, expires_in: timedelta) -> FileCredentialProvider:
+    config = {
+        "lines": {
+            "test_line": {
+                "token": "ABCD",
+                "template_namespace": "test_namespace",
+                "expiry": format_expiry(datetime.now() + expires_in),
+            }
+        }
+    }
+    file_name = tmp_path / "turn_config.json"
+    file_name.write_text(json.dumps(config))
+    return FileCredentialProvider(str(file_name))
+
+
+def rotate(line_name, config):
+    return {
+        "token": "EFGH",
+        "template_namespace": config["template_namespace"],
+        "expiry": format_expiry(datetime.now() + timedelta(days=30)),
+    }
+
+
+def test_token_is_served_from_memory(tmp_path):
+    manager = CredentialManager(write_config(tmp_path, timedelta(days=30)))
+
+    assert manager.token("test_line") == "ABCD"
+    (tmp_path / "turn_config.json").unlink()
+    assert manager.token("test_line") == "ABCD"
+    assert manager.expiry_metrics()["test_line"] > timedelta(days=29).total_seconds()
+
+
+def test_expired_token_without_refresh_callback(tmp_path):
+    manager = CredentialManager(write_config(tmp_path, timedelta(minutes=-5)))
+
+    with pytest.raises(ValueError, match="API key has expired"):
+        manager.token("test_line")
+
+
+def test_expired_token_is_refreshed_once(tmp_path):
+    calls = []
+
+    def refresh_callback(line_name, config):
+        calls.append(line_name)
+        return rotate(line_name, config)
+
+    manager = CredentialManager(
+        write_config(tmp_path, timedelta(minutes=-5)),
+        refresh_callback=refresh_callback,
+    )
+
+    tokens = []
+    threads = [
+        threading.Thread(target=lambda: tokens.append(manager.token("test_line")))
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert tokens == ["EFGH"] * 10
+    assert calls == ["test_line"]
+
+
+def test_token_is_refreshed_in_background_before_expiry(tmp_path):
+    refreshed = threading.Event()
+    warnings = []
+
+    def refresh_callback(line_name, config):
+        refreshed.set()
+        return rotate(line_name, config)
+
+    manager = CredentialManager(
+        write_config(tmp_path, timedelta(hours=2)),
+        refresh_callback=refresh_callback,
+        refresh_before=timedelta(hours=3),
+        on_expiry_warning=lambda line_name, remaining: warnings.append(line_name),
+    )
+
+    assert manager.token("test_line") in ("ABCD", "EFGH")
+    assert refreshed.wait(timeout=5)
+    for _ in range(100):
+        if manager.token("test_line") == "EFGH":
+            break
+        threading.Event().wait(0.01)
+
+    assert manager.token("test_line") == "EFGH"
+    assert warnings == ["test_line"]
+
+
+def test_env_credential_provider():
+    environ = {
+        "TURN_TEST_LINE_TOKEN": "ABCD",
+        "TURN_TEST_LINE_TEMPLATE_NAMESPACE": "test_namespace",
+        "TURN_TEST_LINE_EXPIRY": "Apr 2, 2100 1:16 PM",
+        "HOME": "/root",
+    }
+    provider = EnvCredentialProvider(environ=environ)
+
+    assert provider.token("test_line") == "ABCD"
+    assert list(provider.load()["lines"]) == ["test_line"]
+    with pytest.raises(KeyError):
+        provider.line_config("other_line")
+
+
+def test_cached_env_credentials_with_mixed_case_lines():
+    environ = {
+        "TURN_RISINGLINE_TOKEN": "ABCD",
+        "TURN_RISINGLINE_TEMPLATE_NAMESPACE": "test_namespace",
+        "TURN_RISINGLINE_EXPIRY": "Apr 2, 2100 1:16 PM",
+        "TURN_SERVER_TOKEN": "unrelated",
+    }
+    provider = CachingCredentialProvider(EnvCredentialProvider(environ=environ))
+
+    assert provider.token("RisingLine") == "ABCD"
+    assert list(provider.load()["lines"]) == ["risingline"]
+
+    manager = CredentialManager(provider)
+    assert manager.token("RisingLine") == "ABCD"
+    assert manager.line_config("RISINGLINE")["template_namespace"] == "test_namespace"
+
+
+def test_caching_credential_provider():
+    loads = []
+
+    class CountingProvider(DictCredentialProvider):
+        def load(self):
+            loads.append(1)
+            return super().load()
+
+    config = {
+        "lines": {"test_line": {"token": "ABCD", "expiry": "Apr 2, 2100 1:16 PM"}}
+    }
+    provider = CachingCredentialProvider(CountingProvider(config))
+
+    assert provider.token("test_line") == "ABCD"
+    assert provider.token("test_line") == "ABCD"
+    assert len(loads) == 1
+
+    provider.invalidate()
+    provider.line_config("test_line")
+    assert len(loads) == 2
+
+    expired = {
+        "lines": {"test_line": {"token": "ABCD", "expiry": "Apr 2, 2010 1:16 PM"}}
+    }
+    with pytest.raises(ValueError, match="API key has expired"):
+        DictCredentialProvider(expired).token("test_line")
+
+
+def test_failed_background_refresh_is_not_retried_at_once(tmp_path):
+    calls = []
+
+    def refresh_callback(line_name, config):
+        calls.append(line_name)
+        raise RuntimeError("Turn is down")
+
+    manager = CredentialManager(
+        write_config(tmp_path, timedelta(hours=2)),
+        refresh_callback=refresh_callback,
+        refresh_before=timedelta(hours=3),
+        refresh_retry_interval=60,
+    )
+
+    for _ in range(50):
+        assert manager.token("test_line") == "ABCD"
+        threading.Event().wait(0.002)
+    assert calls == ["test_line"]
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import os
+import threading
+
+import httpx
+import pytest
+
+import turnpy.async_turn_integrator as async_turn_integrator
+import turnpy.turn_integrator as turn_integrator
+from turnpy.credentials import DictCredentialProvider
+
+requires_fork = pytest.mark.skipif(
+    not hasattr(os, "fork"), reason="os.fork is not available on this platform"
+)
+
+CONFIG = {
+    "lines": {
+        "test_line": {
+            "token": "ABCD",
+            "template_namespace": "test_namespace",
+            "expiry": "Apr 2, 2100 1:16 PM",
+        }
+    }
+}
+
+
+def handler(request):
+    return httpx.Response(200, json={"messages": [{"id": "gBEGkYiEB1VXAglK"}]})
+
+
+class MockAsyncTurnClient(async_turn_integrator.AsyncTurnClient):
+    def __init__(self):
+        super().__init__(DictCredentialProvider(CONFIG))
+        self.built = []
+
+    def _build_client(self):
+        client = httpx.AsyncClient(
+            base_url="https://whatsapp.turn.io/v1",
+            transport=httpx.MockTransport(handler),
+        )
+        self.built.append((os.getpid(), client))
+        return client
+
+
+async def send():
+    response = await async_turn_integrator.send_message(
+        "test_line", {"to": "27821234567"}
+    )
+    await async_turn_integrator.turn_client.close()
+    return response.status_code
+
+
+def run_in_child(target) -> str:
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.write(write_fd, json.dumps(target()).encode())
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        result = pipe.read()
+    os.waitpid(pid, 0)
+    return json.loads(result)
+
+
+def test_async_client_per_event_loop_and_thread(monkeypatch):
+    turn_client = MockAsyncTurnClient()
+    monkeypatch.setattr(async_turn_integrator, "turn_client", turn_client)
+
+    results = []
+
+    def worker():
+        for _ in range(2):
+            results.append(asyncio.run(send()))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [200] * 8
+    assert len(turn_client.built) == 8
+
+
+@requires_fork
+def test_async_client_is_rebuilt_after_fork(monkeypatch):
+    turn_client = MockAsyncTurnClient()
+    monkeypatch.setattr(async_turn_integrator, "turn_client", turn_client)
+
+    async def send_without_closing():
+        response = await async_turn_integrator.send_message("test_line", {})
+        return response.status_code
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(send_without_closing()) == 200
+
+        def child():
+            status_code = loop.run_until_complete(send_without_closing())
+            return [status_code, [pid for pid, _ in turn_client.built]]
+
+        status_code, built_by = run_in_child(child)
+    finally:
+        loop.run_until_complete(turn_client.close())
+        loop.close()
+
+    assert status_code == 200
+    assert built_by[0] == os.getpid()
+    assert built_by[1] != os.getpid()
+    assert len(turn_client.built) == 1
+
+
+@requires_fork
+def test_sync_session_is_rebuilt_after_fork(monkeypatch, mock_adapter):
+    class MockTurnClient(turn_integrator.TurnClient):
+        def _build_session(self):
+            session = super()._build_session()
+            session.mount(
+                "https://",
+                mock_adapter(lambda request: (200, {}, {"pid": os.getpid()})),
+            )
+            return session
+
+    turn_client = MockTurnClient(DictCredentialProvider(CONFIG))
+    monkeypatch.setattr(turn_integrator, "turn_client", turn_client)
+    parent_session = turn_client.get_session()
+
+    def child():
+        response = turn_integrator.send_message("test_line", {})
+        return [response.json()["pid"], turn_client.get_session() is parent_session]
+
+    child_pid, shared_session = run_in_child(child)
+
+    assert child_pid != os.getpid()
+    assert not shared_session
+    assert turn_client.get_session() is parent_session
@@ -0,0 +1,63 @@
+import subprocess
+import sys
+
+import pytest
+
+HTTP_STACKS = {"httpx", "requests", "urllib3", "httpcore"}
+
+# Generous, so the suite stays reliable on slow machines: the package's own modules
+# take a few milliseconds to import in total.
+IMPORT_BUDGET_US = 50000
+
+
+def import_times(module: str) -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "turnpy",
+        "turnpy.concurrency_limiter",
+        "turnpy.core",
+        "turnpy.turn_integrator",
+        "turnpy.async_turn_integrator",
+        "turnpy.keyed_executor",
+        "turnpy.profile_buffer",
+        "turnpy.recipients",
+        "turnpy.session_window",
+        "turnpy.validation",
+    ],
+)
+def test_import_does_not_load_http_stacks(module):
+    times = import_times(module)
+    assert module in times
+    assert not HTTP_STACKS & set(times)
+
+
+@pytest.mark.parametrize(
+    "module", ["turnpy.turn_integrator", "turnpy.async_turn_integrator"]
+)
+def test_import_integrator_is_cheap(module):
+    times = import_times(module)
+    # The standard library, e.g. asyncio, is not ours to budget
+    package_time = sum(
+        own for name, (own, _) in times.items() if name.split(".")[0] == "turnpy"
+    )
+    assert package_time < IMPORT_BUDGET_US
+
+
+def test_sync_integrator_does_not_load_asyncio():
+    assert "asyncio" not in import_times("turnpy.turn_integrator")
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import random
+
+import httpx
+import pytest
+
+import turnpy.async_turn_integrator as async_turn_integrator
+from turnpy.keyed_executor import KeyedSequentialExecutor
+from turnpy.messages import build_text_message
+
+
+def test_same_key_runs_in_order_and_keys_run_concurrently():
+    executor = KeyedSequentialExecutor()
+    log = []
+    running = set()
+    overlap = []
+
+    async def part(key, number):
+        running.add(key)
+        overlap.append(len(running))
+        await asyncio.sleep(random.random() / 1000)
+        running.discard(key)
+        log.append((key, number))
+        return number
+
+    async def run():
+        calls = [
+            executor.submit(key, part, key, number)
+            for number in range(3)
+            for key in range(20)
+        ]
+        results = await asyncio.gather(*calls)
+        return results
+
+    results = asyncio.run(run())
+    assert results == [number for number in range(3) for _ in range(20)]
+    for key in range(20):
+        assert [number for logged, number in log if logged == key] == [0, 1, 2]
+    assert max(overlap) > 1
+    assert len(executor) == 0
+
+
+def test_failures_and_cancellation_keep_the_order():
+    executor = KeyedSequentialExecutor()
+    log = []
+
+    async def part(number, fail=False):
+        await asyncio.sleep(0.001)
+        log.append(number)
+        if fail:
+            raise ValueError(number)
+
+    async def run():
+        first = asyncio.ensure_future(executor.submit("k", part, 1, fail=True))
+        second = asyncio.ensure_future(executor.submit("k", part, 2))
+        third = asyncio.ensure_future(executor.submit("k", part, 3))
+        await asyncio.sleep(0)
+        second.cancel()
+        with pytest.raises(ValueError):
+            await first
+        await third
+
+    asyncio.run(run())
+    assert log == [1, 3]
+    assert len(executor) == 0
+
+
+def test_send_message_bulk_keeps_parts_in_order(turn_config, mock_client):
+    received = []
+
+    async def handler(request):
+        await asyncio.sleep(random.random() / 1000)
+        message = json.loads(request.content)
+        received.append((message["to"], message["text"]["body"]))
+        return httpx.Response(200, json={"messages": [{"id": "1"}]})
+
+    msisdns = [f"2782000{number:04}" for number in range(30)]
+    messages = [
+        build_text_message(msisdn, f"Part {part}")
+        for msisdn in msisdns
+        for part in range(3)
+    ]
+
+    async def run():
+        async with mock_client(handler) as client:
+            return [
+                outcome
+                async for outcome in async_turn_integrator.send_message_bulk(
+                    "test_line", messages, concurrency=5, client=client
+                )
+            ]
+
+    outcomes = asyncio.run(run())
+    assert len(outcomes) == 90
+    for msisdn in msisdns:
+        assert [body for to, body in received if to == msisdn] == [
+            "Part 0",
+            "Part 1",
+            "Part 2",
+        ]
@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import httpx
+
+import turnpy.async_turn_integrator as async_turn_integrator
+from turnpy.profile_buffer import ProfileUpdateBuffer
+
+
+def test_updates_are_coalesced_per_msisdn(turn_config, mock_client):
+    patches = []
+
+    def handler(request):
+        assert request.method == "PATCH"
+        patches.append((request.url.path, json.loads(request.content)))
+        return httpx.Response(201, json={"fields": {}})
+
+    async def run():
+        async with mock_client(handler) as client:
+            async with ProfileUpdateBuffer(
+                "test_line", window=60, client=client
+            ) as buffer:
+                buffer.update("27821234567", {"chat_per_week": "1"})
+                buffer.update("27821234567", {"school": "Hillside"})
+                buffer.update("27821234567", {"chat_per_week": "2"})
+                buffer.update("232761234567", {"school": "Riverside"})
+                assert len(buffer) == 2
+
+    asyncio.run(run())
+
+    assert sorted(patches) == [
+        ("/v1/contacts/232761234567/profile", {"school": "Riverside"}),
+        (
+            "/v1/contacts/27821234567/profile",
+            {"chat_per_week": "2", "school": "Hillside"},
+        ),
+    ]
+
+
+def test_updates_are_flushed_after_the_window(turn_config, mock_client):
+    patches = []
+
+    def handler(request):
+        patches.append(json.loads(request.content))
+        return httpx.Response(201, json={"fields": {}})
+
+    async def run():
+        async with mock_client(handler) as client:
+            buffer = ProfileUpdateBuffer("test_line", window=0.01, client=client)
+            buffer.update("27821234567", {"chat_per_week": "1"})
+            await asyncio.sleep(0.1)
+            assert patches == [{"chat_per_week": "1"}]
+            assert len(buffer) == 0
+            assert await buffer.close() == {}
+
+    asyncio.run(run())
+
+
+def test_failed_window_flushes_are_retried_or_reported(turn_config, mock_client):
+    turn_client = async_turn_integrator.AsyncTurnClient()
+    attempts = {}
+
+    def handler(request):
+        msisdn = request.url.path.split("/")[-2]
+        attempts[msisdn] = attempts.get(msisdn, 0) + 1
+        if msisdn == "27821234568":
+            return httpx.Response(400, json={"errors": []})
+        if attempts[msisdn] == 1:
+            return httpx.Response(503)
+        return httpx.Response(201, json={"fields": {}})
+
+    async def run():
+        async with mock_client(handler) as client:
+            buffer = ProfileUpdateBuffer(
+                "test_line", window=0.05, client=client, turn_client=turn_client
+            )
+            buffer.update("27821234567", {"chat_per_week": "1"})
+            buffer.update("27821234568", {"chat_per_week": "1"})
+            await asyncio.sleep(0.07)
+            # The update that failed with a 503 is back in the buffer
+            assert len(buffer) == 1
+            assert buffer.failed == 1
+            return await turn_client.drain(timeout=1.0)
+
+    report = asyncio.run(run())
+    assert report == {"in_flight": 0, "unflushed": 1}
+    assert attempts == {"27821234567": 2, "27821234568": 1}
+
+
+def test_updates_cancelled_by_a_drain_timeout_are_reported(
+    turn_config, mock_client, monkeypatch
+):
+    turn_client = async_turn_integrator.AsyncTurnClient()
+    monkeypatch.setattr(async_turn_integrator, "turn_client", turn_client)
+
+    async def handler(request):
+        await asyncio.sleep(1)
+        return httpx.Response(201, json={"fields": {}})
+
+    async def run():
+        async with mock_client(handler) as client:
+            buffer = ProfileUpdateBuffer("test_line", window=60, client=client)
+            for number in range(5):
+                buffer.update(f"2782123456{number}", {"chat_per_week": "1"})
+            report = await turn_client.drain(timeout=0.1)
+            assert len(buffer) == 5
+            return report
+
+    assert asyncio.run(run()) == {"in_flight": 0, "unflushed": 5}
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from turnpy.recipients import (
+    dedupe_recipients,
+    normalise_msisdn,
+    read_csv_recipients,
+    read_jsonl_recipients,
+    read_recipients,
+)
+
+
+def test_normalise_msisdn():
+    assert normalise_msisdn("+27 82 123-4567") == "27821234567"
+    assert normalise_msisdn("0027821234567") == "27821234567"
+    assert normalise_msisdn("082 123 4567", default_country_code="+27") == "27821234567"
+
+    for invalid in ["082 123 4567", "not a number", "+12", ""]:
+        with pytest.raises(ValueError):
+            normalise_msisdn(invalid)
+
+
+def test_dedupe_recipients():
+    recipients = [{"msisdn": "27821234567"}, {"msisdn": "232761234567"}]
+    recipients.append({"msisdn": "27821234567", "body_params": ["again"]})
+
+    assert [r["msisdn"] for r in dedupe_recipients(recipients)] == [
+        "27821234567",
+        "232761234567",
+    ]
+
+
+def test_read_csv_recipients(tmp_path):
+    csv_file = tmp_path / "cohort.csv"
+    csv_file.write_text(
+        "phone,name,school\n"
+        "+27821234567,Ama,Hillside\n"
+        "invalid,Kofi,Hillside\n"
+        "27821234567,Ama,Hillside\n"
+        "232 76 123 4567,Fatmata,Riverside\n"
+        "27821234568,Kwame\n"
+    )
+
+    recipients = read_csv_recipients(
+        str(csv_file), msisdn_column="phone", body_columns=["name", "school"]
+    )
+
+    assert list(recipients) == [
+        {
+            "msisdn": "27821234567",
+            "header_params": [],
+            "body_params": ["Ama", "Hillside"],
+        },
+        {
+            "msisdn": "232761234567",
+            "header_params": [],
+            "body_params": ["Fatmata", "Riverside"],
+        },
+    ]
+
+    recipients = read_csv_recipients(str(csv_file), msisdn_column="phone", dedupe=False)
+    assert [r["msisdn"] for r in recipients] == [
+        "27821234567",
+        "27821234567",
+        "232761234567",
+        "27821234568",
+    ]
+
+
+def test_read_jsonl_recipients(tmp_path):
+    jsonl_file = tmp_path / "cohort.jsonl"
+    jsonl_file.write_text(
+        json.dumps({"msisdn": "+27821234567", "body_params": ["Ama"]})
+        + "\n\n{not json\n"
+        + json.dumps({"msisdn": "0761234567", "header_params": ["Hi"]})
+        + "\n[1, 2]\n"
+        + json.dumps({"msisdn": "27821234568", "body_params": ["Kwame", None]})
+        + "\n"
+    )
+
+    recipients = list(
+        read_jsonl_recipients(str(jsonl_file), default_country_code="232")
+    )
+
+    assert [r["msisdn"] for r in recipients] == ["27821234567", "232761234567"]
+    assert recipients[1]["header_params"] == ["Hi"]
+    assert [r["msisdn"] for r in read_recipients(str(jsonl_file))] == ["27821234567"]
@@ -0,0 +1,123 @@
+import asyncio
+
+import httpx
+import pytest
+
+import turnpy.async_turn_integrator as async_turn_integrator
+from turnpy.messages import build_text_message
+from turnpy.scheduler import (
+    BULK,
+    INTERACTIVE,
+    DeadlineExceededError,
+    RequestScheduler,
+)
+
+
+def test_interactive_requests_preempt_bulk_requests():
+    order = []
+
+    async def send(name, delay=0.0):
+        await asyncio.sleep(delay)
+        order.append(name)
+        return name
+
+    async def run():
+        async with RequestScheduler(concurrency=1) as scheduler:
+            blocker = asyncio.ensure_future(
+                scheduler.submit(send, "blocker", 0.05, priority=BULK)
+            )
+            await asyncio.sleep(0.01)
+            bulk = [
+                asyncio.ensure_future(
+                    scheduler.submit(send, f"bulk-{i}", priority=BULK)
+                )
+                for i in range(3)
+            ]
+            reply = asyncio.ensure_future(
+                scheduler.submit(send, "reply", priority=INTERACTIVE)
+            )
+            return await asyncio.gather(blocker, *bulk, reply)
+
+    results = asyncio.run(run())
+
+    assert results == ["blocker", "bulk-0", "bulk-1", "bulk-2", "reply"]
+    assert order == ["blocker", "reply", "bulk-0", "bulk-1", "bulk-2"]
+
+
+def test_requests_past_their_deadline_are_dropped():
+    sent = []
+
+    async def send(name, delay=0.0):
+        await asyncio.sleep(delay)
+        sent.append(name)
+
+    async def run():
+        async with RequestScheduler(concurrency=1) as scheduler:
+            blocker = asyncio.ensure_future(scheduler.submit(send, "blocker", 0.05))
+            await asyncio.sleep(0.01)
+            with pytest.raises(DeadlineExceededError):
+                await scheduler.submit(send, "late", deadline=0.01)
+            # The submitter does not wait for a worker to free up to find out
+            assert not blocker.done()
+            await blocker
+            assert scheduler.dropped == 1
+
+    asyncio.run(run())
+
+    assert sent == ["blocker"]
+
+
+def test_errors_are_raised_to_the_submitter():
+    async def fail():
+        raise ValueError("failed")
+
+    async def run():
+        async with RequestScheduler() as scheduler:
+            with pytest.raises(ValueError):
+                await scheduler.submit(fail)
+
+    asyncio.run(run())
+
+
+def test_bulk_sends_queue_behind_conversational_replies(turn_config, mock_client):
+    sent = []
+
+    async def handler(request):
+        await asyncio.sleep(0.001)
+        sent.append(request.url.path)
+        return httpx.Response(200, json={"messages": [{"id": "1"}]})
+
+    async def send_all(client, scheduler):
+        return [
+            outcome
+            async for outcome in async_turn_integrator.send_message_bulk(
+                "test_line",
+                [
+                    build_text_message(f"2782000{number:04}", "Hi")
+                    for number in range(20)
+                ],
+                concurrency=5,
+                client=client,
+                scheduler=scheduler,
+            )
+        ]
+
+    async def run():
+        async with mock_client(handler) as client:
+            async with RequestScheduler(concurrency=1) as scheduler:
+                bulk = asyncio.ensure_future(send_all(client, scheduler))
+                await asyncio.sleep(0.005)
+                await scheduler.submit(
+                    async_turn_integrator.start_journey,
+                    "27820000000",
+                    "test_line",
+                    "stack-uuid",
+                    client=client,
+                    priority=INTERACTIVE,
+                )
+                return await bulk
+
+    outcomes = asyncio.run(run())
+    assert len(outcomes) == 20
+    # Queued behind the bulk send in flight only, not behind the rest of the cohort
+    assert 0 < sent.index("/v1/stacks/stack-uuid/start") < 10
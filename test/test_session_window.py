@@ -0,0 +1,152 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import turnpy.async_turn_integrator as async_turn_integrator
+import turnpy.turn_integrator as turn_integrator
+from turnpy.messages import build_text_message
+from turnpy.session_window import (
+    SESSION_WINDOW,
+    SessionWindowClosedError,
+    SessionWindowIndex,
+    SessionWindowRouter,
+)
+from turnpy.transports import NullTransport
+
+NOW = 1700000000.0
+
+
+def test_index_tracks_last_inbound():
+    index = SessionWindowIndex(margin=60, clock=lambda: NOW)
+
+    index.record_webhook(
+        {
+            "contacts": [{"wa_id": "27820000001"}],
+            "messages": [
+                {"from": "27820000001", "timestamp": str(int(NOW - 3600))},
+                {"from": "27820000002", "timestamp": str(int(NOW - SESSION_WINDOW))},
+            ],
+        }
+    )
+    index.record_webhook({"statuses": [{"id": "1", "status": "read"}]})
+    index.record_profile(
+        "+27820000003", {"fields": {"last_seen_at": "2023-11-14T21:13:00Z"}}
+    )
+    index.record_profile("27820000004", {"fields": {}})
+
+    assert len(index) == 3
+    assert index.in_window("+27820000001")
+    assert not index.in_window("27820000002")
+    assert index.in_window("27820000003")
+    assert not index.in_window("27820000004")
+
+    # An older message does not move the window back
+    index.record_inbound("27820000001", NOW - 7200)
+    assert index.last_inbound("27820000001") == NOW - 3600
+
+    # Contacts within the margin of the end of their window count as outside
+    index.record_inbound("27820000005", NOW - SESSION_WINDOW + 30)
+    assert not index.in_window("27820000005")
+
+    assert index.prune() == 1
+    assert index.last_inbound("27820000002") is None
+
+
+def test_router_sends_the_fallback_template_once_per_contact():
+    index = SessionWindowIndex()
+    index.record_inbound("27820000001")
+    in_window = build_text_message("27820000001", "Lesson 1")
+
+    router = SessionWindowRouter(index)
+    assert router.route(in_window) is in_window
+    with pytest.raises(SessionWindowClosedError):
+        router.route(build_text_message("27820000002", "Lesson 1"))
+
+    router = SessionWindowRouter(
+        index,
+        "lesson_reminder",
+        "test_namespace",
+        header_params=["Lesson 1"],
+        body_params=["Maths", "today"],
+        language="af",
+    )
+    fallback = router.route(build_text_message("+27820000002", "Lesson 1"))
+    assert fallback["type"] == "template"
+    assert fallback["template"]["language"]["code"] == "af"
+    assert [
+        [parameter["text"] for parameter in component["parameters"]]
+        for component in fallback["template"]["components"]
+    ] == [["Lesson 1"], ["Maths", "today"]]
+    with pytest.raises(SessionWindowClosedError):
+        router.route(build_text_message("27820000002", "Lesson 1, part 2"))
+    assert router.route(in_window) is in_window
+
+
+def test_send_message_bulk_routes_out_of_window_contacts(turn_config, mock_client):
+    index = SessionWindowIndex()
+    index.record_inbound("27820000001")
+    sent = []
+
+    def handler(request):
+        sent.append(json.loads(request.content))
+        return httpx.Response(200, json={"messages": [{"id": "1"}]})
+
+    messages = [
+        build_text_message("27820000001", "Lesson 1"),
+        build_text_message("27820000002", "Lesson 1"),
+        build_text_message("27820000002", "Lesson 1, part 2"),
+    ]
+
+    async def run(**kwargs):
+        async with mock_client(handler) as client:
+            return [
+                outcome
+                async for outcome in async_turn_integrator.send_message_bulk(
+                    "test_line",
+                    messages,
+                    session_windows=index,
+                    client=client,
+                    **kwargs,
+                )
+            ]
+
+    outcomes = asyncio.run(run())
+    assert [message["to"] for message in sent] == ["27820000001"]
+    assert sum(isinstance(o, SessionWindowClosedError) for _, o in outcomes) == 2
+
+    sent.clear()
+    outcomes = asyncio.run(
+        run(fallback_template="lesson_reminder", fallback_body_params=["Maths"])
+    )
+    assert sorted((m["to"], m["type"]) for m in sent) == [
+        ("27820000001", "text"),
+        ("27820000002", "template"),
+    ]
+    assert sent[-1]["template"]["namespace"] == "test_namespace"
+    assert sent[-1]["template"]["components"][0]["parameters"][0]["text"] == "Maths"
+    assert sum(isinstance(o, SessionWindowClosedError) for _, o in outcomes) == 1
+
+
+def test_send_message_bulk_sync(turn_config, monkeypatch):
+    monkeypatch.setattr(
+        turn_integrator,
+        "turn_client",
+        turn_integrator.TurnClient(transport=NullTransport()),
+    )
+    index = SessionWindowIndex()
+    index.record_inbound("27820000001")
+
+    outcomes = dict(
+        turn_integrator.send_message_bulk(
+            "test_line",
+            [
+                build_text_message("27820000001", "Hi"),
+                build_text_message("27820000002", "Hi"),
+            ],
+            session_windows=index,
+        )
+    )
+    assert outcomes["27820000001"].status_code == 200
+    assert isinstance(outcomes["27820000002"], SessionWindowClosedError)
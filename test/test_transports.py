@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+import httpx
+
+import turnpy.async_turn_integrator as async_turn_integrator
+import turnpy.turn_integrator as turn_integrator
+from turnpy.transports import (
+    NullTransport,
+    RecordingTransport,
+    ReplayTransport,
+    endpoint_key,
+)
+
+
+def test_endpoint_key():
+    assert endpoint_key("GET", "/v1/contacts/27821234567/profile") == (
+        "GET contacts/*/profile"
+    )
+    assert endpoint_key(
+        "POST", "/v1/stacks/a1b2c3d4-e5f6-a7b8-c9d0-e1f2a3b4c5d6/start"
+    ) == ("POST stacks/*/start")
+    assert endpoint_key("POST", "/v1/messages") == "POST messages"
+
+
+def test_null_transport_async_client(turn_config, monkeypatch):
+    monkeypatch.setattr(
+        async_turn_integrator,
+        "turn_client",
+        async_turn_integrator.AsyncTurnClient(transport=NullTransport()),
+    )
+
+    async def run():
+        results = []
+        async for _, response in async_turn_integrator.send_template_message_bulk(
+            "test_line",
+            "test_template",
+            ({"msisdn": f"2782{i:07}"} for i in range(200)),
+            concurrency=20,
+        ):
+            results.append(response)
+        profile = await async_turn_integrator.obtain_contact_profile(
+            "27821234567", "test_line"
+        )
+        await async_turn_integrator.turn_client.close()
+        return results, profile
+
+    results, profile = asyncio.run(run())
+    assert len(results) == 200
+    assert all(response.status_code == 200 for response in results)
+    assert len({response.json()["messages"][0]["id"] for response in results}) == 200
+    assert profile.json()["fields"] == {}
+
+
+def test_null_transport_error_rate(turn_config, monkeypatch):
+    monkeypatch.setattr(
+        turn_integrator,
+        "turn_client",
+        turn_integrator.TurnClient(
+            transport=NullTransport(error_rate=0.5, error_status=500, seed=1)
+        ),
+    )
+
+    statuses = [
+        turn_integrator.send_message("test_line", {"to": "27821234567"}).status_code
+        for _ in range(200)
+    ]
+    assert set(statuses) == {200, 500}
+    assert 50 < statuses.count(500) < 150
+
+
+def test_record_and_replay(turn_config, tmp_path, monkeypatch):
+    file_name = str(tmp_path / "recording.jsonl")
+
+    def handler(request):
+        return httpx.Response(201, json={"messages": [{"id": "recorded"}]})
+
+    recorder = RecordingTransport(file_name, transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(
+        turn_integrator, "turn_client", turn_integrator.TurnClient(transport=recorder)
+    )
+    response = turn_integrator.send_message("test_line", {"to": "27821234567"})
+    assert response.json() == {"messages": [{"id": "recorded"}]}
+
+    with open(file_name) as file:
+        records = [json.loads(line) for line in file]
+    assert records == [
+        {
+            "endpoint": "POST messages",
+            "status": 201,
+            "body": '{"messages": [{"id": "recorded"}]}',
+        }
+    ]
+
+    monkeypatch.setattr(
+        async_turn_integrator,
+        "turn_client",
+        async_turn_integrator.AsyncTurnClient(transport=ReplayTransport(file_name)),
+    )
+
+    async def run():
+        sent = await async_turn_integrator.send_message(
+            "test_line", {"to": "27820000000"}
+        )
+        missing = await async_turn_integrator.obtain_contact_profile(
+            "27820000000", "test_line"
+        )
+        await async_turn_integrator.turn_client.close()
+        return sent, missing
+
+    sent, missing = asyncio.run(run())
+    assert sent.status_code == 201
+    assert sent.json() == {"messages": [{"id": "recorded"}]}
+    assert missing.status_code == 404
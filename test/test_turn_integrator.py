@@ -1,8 +1,11 @@
 import json
+import threading
+import time
 
 import pytest
 
 import turnpy.turn_integrator as turn_integrator
+from turnpy.credentials import DictCredentialProvider
 
 
 def load_test_config():
@@ -230,3 +233,173 @@ def test_send_template_message():
 
     assert response.status_code == 200
     assert response_text["messages"][0]["id"]
+
+
+def test_run_bulk():
+    def worker(item):
+        if item == 3:
+            raise ValueError("failed")
+        return item * 2
+
+    outcomes = dict(turn_integrator._run_bulk(iter(range(20)), worker, 4))
+
+    assert isinstance(outcomes.pop(3), ValueError)
+    assert outcomes == {item: item * 2 for item in range(20) if item != 3}
+
+
+def test_turn_client_credential_provider(monkeypatch):
+    config = {
+        "lines": {
+            "test_line": {
+                "token": "ABCD",
+                "template_namespace": "test_namespace",
+                "expiry": "Apr 2, 2100 1:16 PM",
+            }
+        }
+    }
+    client = turn_integrator.TurnClient(DictCredentialProvider(config))
+    monkeypatch.setattr(turn_integrator, "turn_client", client)
+
+    assert turn_integrator.turn_credentials("test_line") == "ABCD"
+    assert turn_integrator.template_namespace("test_line") == "test_namespace"
+
+
+@pytest.fixture
+def mock_turn_client(monkeypatch, mock_adapter):
+    config = {
+        "lines": {
+            "test_line": {
+                "token": "ABCD",
+                "template_namespace": "test_namespace",
+                "expiry": "Apr 2, 2100 1:16 PM",
+            }
+        }
+    }
+    client = turn_integrator.TurnClient(DictCredentialProvider(config))
+    monkeypatch.setattr(turn_integrator, "turn_client", client)
+
+    def mount(handler):
+        client.get_session().mount("https://", mock_adapter(handler))
+        return client
+
+    return mount
+
+
+def test_start_journey_bulk(mock_turn_client):
+    attempts = {}
+
+    def handler(request):
+        msisdn = json.loads(request.body)["wa_id"]
+        attempts[msisdn] = attempts.get(msisdn, 0) + 1
+        assert request.url.endswith("/stacks/stack-uuid/start")
+        assert request.headers["Authorization"] == "Bearer ABCD"
+        if msisdn == "27821234567" and attempts[msisdn] == 1:
+            return 429, {"Retry-After": "0"}, {}
+        return 201, {}, {"success": True}
+
+    mock_turn_client(handler)
+    msisdns = [f"2782123456{digit}" for digit in range(10)]
+
+    outcomes = dict(
+        turn_integrator.start_journey_bulk(
+            "stack-uuid", msisdns, "test_line", concurrency=3
+        )
+    )
+
+    assert {msisdn: r.status_code for msisdn, r in outcomes.items()} == {
+        msisdn: 201 for msisdn in msisdns
+    }
+    assert attempts["27821234567"] == 2
+
+
+def test_start_journey_bulk_picks_up_rotated_tokens(mock_turn_client):
+    tokens = []
+
+    def handler(request):
+        tokens.append(request.headers["Authorization"])
+        # The token is rotated during the run, e.g. by a CredentialManager
+        line["token"] = "EFGH"
+        return 201, {}, {"success": True}
+
+    client = mock_turn_client(handler)
+    line = client.credential_provider.config["lines"]["test_line"]
+    msisdns = [f"2782123456{digit}" for digit in range(3)]
+
+    outcomes = dict(
+        turn_integrator.start_journey_bulk(
+            "stack-uuid", msisdns, "test_line", concurrency=1
+        )
+    )
+
+    assert len(outcomes) == 3
+    assert tokens == ["Bearer ABCD", "Bearer EFGH", "Bearer EFGH"]
+
+
+def test_release_claims_bulk(mock_turn_client):
+    claims = {
+        "27821234560": "journey-1-claim",
+        "27821234561": "journey-1-other",
+        "27821234562": "journey-2-claim",
+    }
+    released = []
+
+    def handler(request):
+        msisdn = request.url.split("/")[-2]
+        if request.method == "GET":
+            if msisdn == "27821234564":
+                return 500, {}, {}
+            if msisdn not in claims:
+                return 404, {}, {"errors": ["No conversation claim"]}
+            return 200, {}, {"uuid": claims[msisdn]}
+
+        assert json.loads(request.body) == {"claim_uuid": claims[msisdn]}
+        released.append(msisdn)
+        return 200, {}, {"claim_uuid": claims[msisdn]}
+
+    mock_turn_client(handler)
+    msisdns = [f"2782123456{digit}" for digit in range(5)]
+
+    summary = turn_integrator.release_claims_bulk(
+        msisdns, "test_line", claim_uuid_prefix="journey-1"
+    )
+
+    assert sorted(summary["released"]) == ["27821234560", "27821234561"]
+    assert summary["skipped"] == ["27821234562"]
+    assert summary["unclaimed"] == ["27821234563"]
+    assert summary["failed"] == ["27821234564"]
+    assert sorted(released) == sorted(summary["released"])
+
+
+def test_drain_waits_for_in_flight_requests(mock_turn_client):
+    from turnpy.exceptions import ClientClosedError
+
+    started = threading.Event()
+
+    def handler(request):
+        started.set()
+        time.sleep(0.05)
+        return 200, {}, {"messages": [{"id": "gBEGkYiEB1VXAglK"}]}
+
+    responses = []
+    with mock_turn_client(handler) as client:
+        sender = threading.Thread(
+            target=lambda: responses.append(
+                turn_integrator.send_message("test_line", {"to": "27821234567"})
+            )
+        )
+        sender.start()
+        started.wait()
+
+        assert client.drain(timeout=1.0) == {"in_flight": 0, "unflushed": 0}
+        with pytest.raises(ClientClosedError):
+            turn_integrator.send_message("test_line", {"to": "27821234567"})
+        sender.join()
+
+    assert responses[0].status_code == 200
+
+    # Closing the client does not undo the drain, reopening it does
+    with pytest.raises(ClientClosedError):
+        turn_integrator.send_message("test_line", {"to": "27821234567"})
+    client.reopen()
+    mock_turn_client(handler)
+    assert turn_integrator.send_message("test_line", {"to": "27821234567"}).ok
@@ -0,0 +1,176 @@
+import asyncio
+
+import httpx
+import pytest
+
+import turnpy.async_turn_integrator as async_turn_integrator
+from turnpy.messages import (
+    build_interactive_message,
+    build_media_message,
+    build_template_message,
+    build_text_message,
+)
+from turnpy.validation import (
+    PayloadValidationError,
+    check_message,
+    validate_campaign,
+    validate_message,
+)
+
+
+def test_valid_messages():
+    assert validate_message(build_text_message("27821234567", "Hi!")) == []
+    assert validate_message(build_media_message("27821234567", "sticker", "id")) == []
+    assert (
+        validate_message(
+            build_template_message("27821234567", "namespace", "welcome", ["Hi"])
+        )
+        == []
+    )
+    assert (
+        validate_message(
+            build_interactive_message(
+                "27821234567",
+                "button",
+                {
+                    "body_text": "Ready?",
+                    "buttons": [{"callback_id": "yes", "text": "Yes"}],
+                },
+            )
+        )
+        == []
+    )
+
+
+def test_invalid_interactive_messages():
+    button_message = build_interactive_message(
+        "not a number",
+        "button",
+        {
+            "header_text": "Header",
+            "body_text": "Ready?",
+            "buttons": [
+                {"callback_id": "1", "text": "A title that is far too long"},
+                {"callback_id": "1", "text": "Two"},
+                {"callback_id": "3", "text": "Three"},
+                {"callback_id": "4", "text": "Four"},
+            ],
+        },
+    )
+    assert validate_message(button_message) == [
+        "recipient 'not a number' is not a valid msisdn",
+        "button messages need 1 to 3 buttons",
+        "button 1 title is longer than 20 characters",
+        "button 2 id is not unique",
+    ]
+
+    list_message = build_interactive_message(
+        "27821234567",
+        "list",
+        {
+            "body_text": "Pick one",
+            "list_title": "Lessons",
+            "list_items": [
+                {"callback_id": str(i), "text": "Lesson"} for i in range(11)
+            ],
+        },
+    )
+    with pytest.raises(PayloadValidationError) as excinfo:
+        check_message(list_message)
+    assert excinfo.value.errors == [
+        "list button is required",
+        "list messages need 1 to 10 rows",
+    ]
+
+
+def test_validate_campaign():
+    messages = [
+        build_text_message("27821234567", "Hi!"),
+        build_text_message("27821234567", "x" * 5000),
+        build_template_message("27821234568", "namespace", "", body_params=[""]),
+    ]
+
+    assert validate_campaign(messages) == {
+        "valid": 1,
+        "invalid": [
+            {
+                "index": 1,
+                "to": "27821234567",
+                "errors": ["text body is longer than 4096 characters"],
+            },
+            {
+                "index": 2,
+                "to": "27821234568",
+                "errors": ["template name is required", "body parameter 1 is empty"],
+            },
+        ],
+    }
+
+
+def test_malformed_payloads_are_reported():
+    assert validate_message({"to": "27821234567", "type": "text", "text": "hi"}) == [
+        "text must be an object",
+        "text body is required",
+    ]
+    assert validate_message(
+        {
+            "to": "27821234567",
+            "type": "interactive",
+            "interactive": {
+                "type": "button",
+                "body": {"text": "Ready?"},
+                "footer": None,
+                "action": {"buttons": ["yes"]},
+            },
+        }
+    ) == [
+        "footer text is required",
+        "button 1 must be an object",
+    ]
+    assert validate_message(
+        {
+            "to": "27821234567",
+            "type": "template",
+            "template": {
+                "namespace": "namespace",
+                "name": "welcome",
+                "components": [{"parameters": [{"type": "text", "text": ""}]}],
+            },
+        }
+    ) == [
+        "template component 1 type is required",
+        "component 1 parameter 1 is empty",
+    ]
+
+    assert validate_campaign(["hi", build_text_message("27821234567", "Hi!")]) == {
+        "valid": 1,
+        "invalid": [
+            {"index": 0, "to": None, "errors": ["message payload must be an object"]}
+        ],
+    }
+
+
+def test_client_rejects_invalid_payloads_before_sending(
+    turn_config, mock_client, monkeypatch
+):
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        return httpx.Response(200)
+
+    monkeypatch.setattr(
+        async_turn_integrator,
+        "turn_client",
+        async_turn_integrator.AsyncTurnClient(validate_payloads=True),
+    )
+
+    async def run():
+        async with mock_client(handler) as client:
+            with pytest.raises(PayloadValidationError):
+                await async_turn_integrator.send_message(
+                    "test_line", build_text_message("27821234567", ""), client=client
+                )
+
+    asyncio.run(run())
+    assert sent == []
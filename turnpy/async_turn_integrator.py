@@ -1,41 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+import functools
 import json
 import logging
-from datetime import datetime
+import os
+import threading
+import weakref
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Iterable
+
+from turnpy import core
+from turnpy.circuit_breaker import CircuitBreaker
+from turnpy.concurrency_limiter import AdaptiveConcurrencyLimiter
+from turnpy.credentials import (
+    CredentialManager,
+    CredentialProvider,
+    FileCredentialProvider,
+    check_expiry,
+)
+from turnpy.exceptions import ClientClosedError
+from turnpy.keyed_executor import KeyedSequentialExecutor
+from turnpy.messages import (
+    build_interactive_message,
+    build_media_message,
+    build_template_message,
+    build_text_message,
+)
+from turnpy.scheduler import BULK, RequestScheduler
+from turnpy.session_window import SessionWindowIndex, SessionWindowRouter
+from turnpy.validation import check_message
+
+if TYPE_CHECKING:
+    import httpx
+
+"""
+The client holds the pooled HTTP connections, the credential provider and the optional
+circuit breaker shared by all calls. With validate_payloads set, send_message checks
+every payload locally and raises a PayloadValidationError instead of sending an
+invalid one. Pass a transport from turnpy.transports to load test without sending
+anything to Turn. With a concurrency limiter from turnpy.concurrency_limiter, the
+requests in flight per line adapt to the latency and errors of Turn. Replace the
+module level turn_client to use another provider or a circuit breaker, e.g.:
+turn_client = AsyncTurnClient(
+    CachingCredentialProvider(EnvCredentialProvider()), CircuitBreaker()
+)
+
+Use the client as an async context manager, or call drain() and close() on shutdown,
+so in-flight sends and registered buffers are completed before the process exits. A
+drained client keeps rejecting requests, also after close(), until it is reopened.
+
+An httpx client is bound to the event loop it was created on and its connections must
+not be shared with a forked process. So the client keeps a connection pool per event
+loop, and drops all pools in a child process after a fork, e.g. in gunicorn or celery
+prefork workers. The pools are rebuilt transparently on first use.
+"""
 
-import httpx
-import requests
+_turn_clients = weakref.WeakSet()
+
+DRAIN_POLL_INTERVAL = 0.01
 
 
 class AsyncTurnClient:
-    def __init__(self):
-        self._client = None
-
-    async def get_client(self):
-        if self._client is None:
-            self._client = httpx.AsyncClient(
-                base_url="https://whatsapp.turn.io/v1",
-                timeout=30.0,
-                transport=httpx.AsyncHTTPTransport(retries=3),
-                limits=httpx.Limits(
-                    max_connections=100,
-                    max_keepalive_connections=20,
-                    keepalive_expiry=10.0,
-                ),
-            )
-        return self._client
+    def __init__(
+        self,
+        credential_provider: CredentialProvider = None,
+        circuit_breaker: CircuitBreaker = None,
+        validate_payloads: bool = False,
+        transport=None,
+        concurrency_limiter: AdaptiveConcurrencyLimiter = None,
+    ):
+        self.credential_provider = credential_provider or FileCredentialProvider()
+        self.circuit_breaker = circuit_breaker
+        self.validate_payloads = validate_payloads
+        self.transport = transport
+        self.concurrency_limiter = concurrency_limiter
+        self._drainables = weakref.WeakSet()
+        self._accepting = True
+        self._reset()
+        _turn_clients.add(self)
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._clients = weakref.WeakKeyDictionary()
+        self._in_flight = 0
+
+    def _build_client(self) -> httpx.AsyncClient:
+        import httpx
+
+        return httpx.AsyncClient(
+            base_url=core.BASE_URL,
+            timeout=30.0,
+            transport=self.transport or httpx.AsyncHTTPTransport(retries=3),
+            limits=httpx.Limits(
+                max_connections=100,
+                max_keepalive_connections=20,
+                keepalive_expiry=10.0,
+            ),
+        )
+
+    async def get_client(self) -> httpx.AsyncClient:
+        if self._pid != os.getpid():
+            self._reset()
+
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            with self._lock:
+                client = self._clients.get(loop)
+                if client is None or client.is_closed:
+                    client = self._clients[loop] = self._build_client()
+        return client
 
     async def close(self):
-        if self._client:
-            await self._client.aclose()
-            self._client = None
-
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.pop(loop, None)
+            for other_loop in [other for other in self._clients if other.is_closed()]:
+                del self._clients[other_loop]
+        if client:
+            await client.aclose()
+
+    """
+    Accept requests again after a drain. Entering the client as a context manager
+    reopens it, so the module level turn_client can be used for more than one run.
+    """
+
+    def reopen(self) -> None:
+        with self._lock:
+            self._accepting = True
+
+    async def __aenter__(self):
+        self.reopen()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.drain()
+        await self.close()
+
+    """
+    Register an object to be drained on shutdown, like a ProfileUpdateBuffer or a
+    RequestScheduler. It must have an async drain() method returning the number of
+    items it could not complete, and a __len__ with the number of items it holds.
+    """
+
+    def register(self, drainable) -> None:
+        self._drainables.add(drainable)
+
+    def _start_request(self) -> None:
+        with self._lock:
+            if not self._accepting:
+                raise ClientClosedError("The Turn client is draining for shutdown.")
+            self._in_flight += 1
+
+    def _finish_request(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    """
+    Prepare for shutdown, e.g. on SIGTERM during a deploy.
+
+    Registered buffers and schedulers are drained first, so their pending work still
+    goes out. Then the client stops accepting new requests, raising ClientClosedError,
+    and waits for the requests in flight on any event loop. Returns a report with the
+    number of requests still 'in_flight' and of buffered items 'unflushed' when the
+    timeout ran out.
+    """
+
+    async def drain(self, timeout: float = 30.0) -> dict:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        unflushed = 0
+        for drainable in list(self._drainables):
+            try:
+                unflushed += await asyncio.wait_for(
+                    drainable.drain(), max(deadline - loop.time(), 0)
+                )
+            except asyncio.TimeoutError:
+                unflushed += len(drainable)
+            except Exception:
+                logger.exception(f"Failed to drain {drainable!r}")
+                unflushed += len(drainable)
+
+        self._accepting = False
+        # Requests may be in flight on other threads' event loops, so poll the count
+        while self._in_flight and loop.time() < deadline:
+            await asyncio.sleep(DRAIN_POLL_INTERVAL)
+
+        report = {"in_flight": self._in_flight, "unflushed": unflushed}
+        if any(report.values()):
+            logger.warning(f"Turn client drained with incomplete work: {report}")
+        return report
+
+
+def _reset_after_fork() -> None:
+    for client in list(_turn_clients):
+        client._reset()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
 
 turn_client = AsyncTurnClient()
 
 
 """SETUP"""
 """
-Load and evaluate the credentials from the turn_config.json file.
+Load and evaluate the credentials from the credential provider of the turn_client,
+by default the turn_config.json file.
 """
 
 logger = logging.getLogger(__name__)
@@ -54,21 +226,79 @@ Determine if the Turn credentials are still valid.
 
 
 async def eval_credentials(config_json: json) -> str:
-    with open("turn_config.json", "r") as file:
-        turn_config = json.load(file)
-
-    token_expiry = datetime.strptime(config_json["expiry"], "%b %d, %Y %I:%M %p")
-    if token_expiry > datetime.now():
-        return config_json["token"]
-    else:
-        raise ValueError("API key has expired for this Turn line.")
+    return check_expiry(config_json)
 
 
 async def turn_credentials(line_name):
-    config_json = await load_credentials("turn_config.json", line_name)
+    provider = turn_client.credential_provider
+    if (
+        isinstance(provider, CredentialManager)
+        and provider.seconds_until_expiry(line_name) <= 0
+    ):
+        # Refreshing an expired token blocks, so keep it off the event loop
+        return await asyncio.to_thread(provider.token, line_name)
+
+    return provider.token(line_name)
+
+
+"""
+Send a request built by turnpy.core through the pooled client, or through the client
+passed in.
+
+The request is tracked as in flight on the turn_client, which rejects it with a
+ClientClosedError while draining. If the turn_client has a circuit breaker, it is
+keyed by the line name and endpoint of the request, and raises a CircuitOpenError
+without sending while Turn is failing. If it has a concurrency limiter, the request
+then waits for a free slot on its line. The circuit is checked first, so a request
+to a failing endpoint fails fast instead of waiting for a slot.
+"""
 
-    credentials = await eval_credentials(config_json)
-    return credentials
+
+async def _request(
+    turn_request: core.TurnRequest, client: httpx.AsyncClient = None
+) -> httpx.Response:
+    owner = turn_client
+    owner._start_request()
+    try:
+        if not client:
+            client = await owner.get_client()
+
+        import httpx
+
+        with core.CircuitOutcome(
+            owner.circuit_breaker, turn_request, httpx.HTTPError
+        ) as outcome:
+            response = await _send(owner, turn_request, client)
+            outcome.response(response.status_code)
+        return response
+    finally:
+        owner._finish_request()
+
+
+async def _send(
+    owner: AsyncTurnClient, turn_request: core.TurnRequest, client: httpx.AsyncClient
+) -> httpx.Response:
+    method, path = turn_request.method, turn_request.path
+    kwargs = {"headers": turn_request.headers, "content": turn_request.body}
+
+    limiter = owner.concurrency_limiter
+    if limiter is None:
+        return await client.request(method, path, **kwargs)
+
+    import httpx
+
+    line_name, endpoint = turn_request.line_name, turn_request.endpoint
+    started = await limiter.acquire(line_name)
+    try:
+        response = await client.request(method, path, **kwargs)
+    except httpx.TransportError:
+        limiter.release(line_name, started, failed=True, endpoint=endpoint)
+        raise
+    except BaseException:
+        limiter.release(line_name, started, endpoint=endpoint)
+        raise
+    limiter.release(line_name, started, response.status_code, endpoint=endpoint)
+    return response
 
 
 """CONTACTS"""
@@ -84,13 +314,10 @@ async def obtain_contact_profile(
     msisdn: str, line_name: str, client: httpx.AsyncClient = None
 ) -> httpx.Response:
     turn_creds = await turn_credentials(line_name)
-    auth_headers = {
-        "Authorization": f"Bearer {turn_creds}",
-        "Accept": "application/vnd.v1+json",
-    }
-    if not client:
-        client = await turn_client.get_client()
-    response = await client.get(f"contacts/{msisdn}/profile", headers=auth_headers)
+    response = await _request(
+        core.obtain_contact_profile_request(msisdn, line_name, turn_creds),
+        client=client,
+    )
 
     logging.debug(f"Obtained contact profile response: {response.text}")
     return response
@@ -107,17 +334,11 @@ async def update_contact_profile(
     msisdn: str, line_name: str, profile_data: json, client: httpx.AsyncClient = None
 ) -> httpx.Response:
     turn_creds = await turn_credentials(line_name)
-    auth_headers = {
-        "Authorization": f"Bearer {turn_creds}",
-        "Accept": "application/vnd.v1+json",
-    }
-
-    if not client:
-        client = await turn_client.get_client()
-    response = await client.patch(
-        f"contacts/{msisdn}/profile",
-        headers=auth_headers,
-        json=profile_data,
+    response = await _request(
+        core.update_contact_profile_request(
+            msisdn, line_name, turn_creds, profile_data
+        ),
+        client=client,
     )
     logging.debug(f"Updated contact profile response: {response.text}")
     return response
@@ -134,12 +355,13 @@ See documentation here: https://whatsapp.turn.io/docs/api/messages
 async def send_message(
     line_name: str, message_data: json, client: httpx.AsyncClient = None
 ) -> httpx.Response:
-    turn_creds = await turn_credentials(line_name)
-    auth_headers = {"Authorization": f"Bearer {turn_creds}"}
+    if turn_client.validate_payloads and not isinstance(message_data, bytes):
+        check_message(message_data)
 
-    if not client:
-        client = await turn_client.get_client()
-    response = await client.post("messages", headers=auth_headers, json=message_data)
+    turn_creds = await turn_credentials(line_name)
+    response = await _request(
+        core.send_message_request(line_name, turn_creds, message_data), client=client
+    )
     logger.info("Sent a message...")
     return response
 
@@ -155,13 +377,7 @@ another type of recipient.
 async def send_text_message(
     msisdn: str, line_name: str, message: str
 ) -> httpx.Response:
-    message_data = {
-        "preview_url": False,
-        "recipient_type": "individual",
-        "to": f"{msisdn}",
-        "type": "text",
-        "text": {"body": message},
-    }
+    message_data = build_text_message(msisdn, message)
 
     response = await send_message(line_name, message_data)
     logger.debug(f"Sent text message response: {response.text}")
@@ -176,32 +392,7 @@ async def send_media_message(
     caption="",
     message: str = "",
 ) -> httpx.Response:
-    message_data = {
-        "to": msisdn,
-        "recipient_type": "individual",
-    }
-    if media_type == "audio":
-        message_data["type"] = "audio"
-        message_data["audio"] = {"id": media_id}
-
-    elif media_type == "document":
-        message_data["type"] = "document"
-        message_data["document"] = {"id": media_id, "caption": caption}
-
-    elif media_type == "image":
-        message_data["type"] = "image"
-        message_data["image"] = {"id": media_id, "caption": caption}
-
-    elif media_type == "sticker":
-        message_data["type"] = "sticket"
-        message_data["sticket"] = {"id": media_id}
-
-    elif media_type == "video":
-        message_data["type"] = "video"
-        message_data["video"] = {"id": media_id, "caption": caption}
-
-    if message:
-        message_data["text"] = {"body": message}
+    message_data = build_media_message(msisdn, media_type, media_id, caption, message)
 
     response = await send_message(line_name, message_data)
     logger.debug(f"Sent media message response: {response.text}")
@@ -227,52 +418,7 @@ https://whatsapp.turn.io/docs/api/messages#interactive-messages
 async def send_interactive_message(
     msisdn: str, line_name: str, interactive_type: str, sections: json
 ) -> httpx.Response:
-    message_data = {
-        "to": msisdn,
-        "type": "interactive",
-        "interactive": {
-            "type": interactive_type,
-            "body": {"text": sections["body_text"]},
-            "action": {},
-        },
-    }
-
-    if sections["header_text"]:
-        message_data["interactive"]["header"] = {
-            "type": "text",
-            "text": sections["header_text"],
-        }
-    elif sections["header_image"]:
-        message_data["interactive"]["header"] = {
-            "type": "image",
-            "id": sections["header_image"],
-        }
-
-    if sections["footer_text"]:
-        message_data["interactive"]["footer"] = {"text": sections["footer_text"]}
-
-    if interactive_type == "button":
-        message_data["interactive"]["action"]["buttons"] = []
-        for button in sections["buttons"]:
-            message_data["interactive"]["action"]["buttons"].append(
-                {
-                    "type": "reply",
-                    "reply": {"id": button["callback_id"], "title": button["text"]},
-                }
-            )
-
-    if interactive_type == "list":
-        message_data["interactive"]["action"]["button"] = sections["list_button"]
-        message_data["interactive"]["action"]["sections"] = []
-        message_data["interactive"]["action"]["sections"].append({})
-        message_data["interactive"]["action"]["sections"][0]["title"] = sections[
-            "list_title"
-        ]
-        message_data["interactive"]["action"]["sections"][0]["rows"] = []
-        for list_item in sections["list_items"]:
-            message_data["interactive"]["action"]["sections"][0]["rows"].append(
-                {"id": list_item["callback_id"], "title": list_item["text"]}
-            )
+    message_data = build_interactive_message(msisdn, interactive_type, sections)
 
     response = await send_message(line_name, message_data)
     logger.debug(f"Sent interactive message response: {response.text}")
@@ -292,14 +438,10 @@ async def save_media(
     line_name: str, type: str, file_binary: str, client: httpx.AsyncClient = None
 ) -> httpx.Response:
     turn_creds = await turn_credentials(line_name)
-    auth_headers = {
-        "Authorization": f"Bearer {turn_creds}",
-        "Content-Type": type,
-    }
-
-    if not client:
-        client = await turn_client.get_client()
-    response = await client.post("media", headers=auth_headers, data=file_binary)
+    response = await _request(
+        core.save_media_request(line_name, turn_creds, type, file_binary),
+        client=client,
+    )
     logger.info(f"Saved media response {response.text}")
     return response
 
@@ -322,6 +464,11 @@ https://whatsapp.turn.io/docs/api/messages#template-messages
 """
 
 
+async def template_namespace(line_name: str) -> str:
+    config_json = turn_client.credential_provider.line_config(line_name)
+    return config_json["template_namespace"]
+
+
 async def send_template_message(
     msisdn: str,
     line_name: str,
@@ -330,35 +477,14 @@ async def send_template_message(
     body_params: list = None,
     language: str = "en",
 ) -> httpx.Response:
-    # Get credentials and config
-    config_json = await load_credentials("turn_config.json", line_name)
-    template_namespace = config_json["template_namespace"]
-
-    # Build the message data
-    message_data = {
-        "to": msisdn,
-        "type": "template",
-        "template": {
-            "namespace": template_namespace,
-            "name": template_name,
-            "language": {"code": language, "policy": "deterministic"},
-            "components": [],
-        },
-    }
-
-    if header_params:
-        header_component = {
-            "type": "header",
-            "parameters": [{"type": "text", "text": param} for param in header_params],
-        }
-        message_data["template"]["components"].append(header_component)
-
-    if body_params:
-        body_component = {
-            "type": "body",
-            "parameters": [{"type": "text", "text": param} for param in body_params],
-        }
-        message_data["template"]["components"].append(body_component)
+    message_data = build_template_message(
+        msisdn,
+        await template_namespace(line_name),
+        template_name,
+        header_params,
+        body_params,
+        language,
+    )
 
     response = await send_message(line_name, message_data)
     logger.debug(f"Send a template message: {response.text}")
@@ -378,14 +504,9 @@ async def determine_claim(
     msisdn: str, line_name: str, client: httpx.AsyncClient = None
 ) -> httpx.Response:
     turn_creds = await turn_credentials(line_name)
-    auth_headers = {
-        "Authorization": f"Bearer {turn_creds}",
-        "Accept": "application/vnd.v1+json",
-    }
-
-    if not client:
-        client = await turn_client.get_client()
-    response = await client.get(f"contacts/{msisdn}/claim", headers=auth_headers)
+    response = await _request(
+        core.determine_claim_request(msisdn, line_name, turn_creds), client=client
+    )
     logger.debug(f"Determined claim response: {response.text}")
     return response
 
@@ -393,20 +514,10 @@ async def determine_claim(
 async def release_claim(
     msisdn: str, line_name: str, claim_uuid: str, client: httpx.AsyncClient = None
 ) -> httpx.Response:
-    claim_data = {"claim_uuid": claim_uuid}
-
     turn_creds = await turn_credentials(line_name)
-    auth_headers = {
-        "Authorization": f"Bearer {turn_creds}",
-        "Accept": "application/vnd.v1+json",
-    }
-
-    if not client:
-        client = await turn_client.get_client()
-    response = await client.delete(
-        f"contacts/{msisdn}/claim",
-        headers=auth_headers,
-        json=claim_data,
+    response = await _request(
+        core.release_claim_request(msisdn, line_name, turn_creds, claim_uuid),
+        client=client,
     )
     logger.debug(f"Released claim response: {response.text}")
     return response
@@ -423,21 +534,299 @@ Details here: https://whatsapp.turn.io/docs/api/stacks
 async def start_journey(
     msisdn: str, line_name: str, stack_uuid: str, client: httpx.AsyncClient = None
 ) -> httpx.Response:
-    journey_data = {"wa_id": msisdn}
-
     turn_creds = await turn_credentials(line_name)
-    auth_headers = {
-        "Authorization": f"Bearer {turn_creds}",
-        "Accept": "application/vnd.v1+json",
-    }
+    response = await _request(
+        core.start_journey_request(msisdn, line_name, turn_creds, stack_uuid),
+        client=client,
+    )
+    logger.debug(f"Started journey response: {response.text}")
+    return response
 
+
+"""BULK"""
+"""
+Retry a request that Turn rejected with 429 Too Many Requests.
+
+The wait between attempts follows the Retry-After header of the response, falling
+back to one second. After 'retries' attempts the last 429 response is returned. With a
+scheduler, every attempt is queued on it with BULK priority.
+"""
+
+RATE_LIMIT_RETRIES = 3
+
+
+async def _respect_rate_limit(
+    request: Callable[[], Awaitable[httpx.Response]],
+    retries: int = RATE_LIMIT_RETRIES,
+    scheduler: RequestScheduler = None,
+) -> httpx.Response:
+    if scheduler is not None:
+        request = functools.partial(scheduler.submit, request, priority=BULK)
+
+    response = await request()
+    for _ in range(retries):
+        if response.status_code != 429:
+            break
+        delay = core.retry_after(response.headers)
+        logger.warning(f"Rate limited by Turn, retrying in {delay} seconds")
+        await asyncio.sleep(delay)
+        response = await request()
+    return response
+
+
+"""
+Run a coroutine for every item of an iterable with bounded concurrency.
+
+Items are only pulled from the iterable when a slot frees up and the caller asks for
+the next outcome, so a lazy iterable such as the readers in turnpy.recipients is
+consumed at the pace of the network and memory stays constant. Outcomes are yielded
+as (item, result) pairs in completion order, where the result is either the return
+value of the worker or the exception it raised.
+"""
+
+
+async def _run_bulk(
+    items: Iterable, worker: Callable[..., Awaitable], concurrency: int
+) -> AsyncIterator[tuple]:
+    if concurrency < 1:
+        raise ValueError("Bulk concurrency must be at least 1.")
+
+    iterator = iter(items)
+    pending = {}
+    try:
+        while True:
+            for item in iterator:
+                pending[asyncio.ensure_future(worker(item))] = item
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                return
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                item = pending.pop(task)
+                if task.exception() is not None:
+                    yield item, task.exception()
+                else:
+                    yield item, task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+"""
+Send a templated message to every recipient of a cohort.
+
+The arguments are:
+'line_name' - string, required Turn line to use
+'template_name' - string, required name of the template to use
+'recipients' - iterable, required dictionaries with an 'msisdn' and optional
+'header_params' and 'body_params' lists, e.g. from turnpy.recipients.read_recipients
+'language' - string, optional language code for the template (default: 'en')
+'concurrency' - int, optional maximum number of requests in flight (default: 10)
+'scheduler' - RequestScheduler, optional scheduler to queue the sends on with BULK
+priority, so conversational replies on the same scheduler go first
+
+The template namespace is loaded once for the whole run. Yields (msisdn, response)
+pairs as sends complete; a failed send yields the exception instead of a response.
+"""
+
+
+async def send_template_message_bulk(
+    line_name: str,
+    template_name: str,
+    recipients: Iterable[dict],
+    language: str = "en",
+    concurrency: int = 10,
+    client: httpx.AsyncClient = None,
+    scheduler: RequestScheduler = None,
+) -> AsyncIterator[tuple]:
+    namespace = await template_namespace(line_name)
+
+    async def send(recipient):
+        message_data = build_template_message(
+            recipient["msisdn"],
+            namespace,
+            template_name,
+            recipient.get("header_params"),
+            recipient.get("body_params"),
+            language,
+        )
+        return await _respect_rate_limit(
+            lambda: send_message(line_name, message_data, client=client),
+            scheduler=scheduler,
+        )
+
+    async for recipient, outcome in _run_bulk(recipients, send, concurrency):
+        logger.debug(f"Bulk template message to {recipient['msisdn']}: {outcome}")
+        yield recipient["msisdn"], outcome
+
+
+"""
+Send free-form messages, e.g. built with turnpy.messages, to many contacts.
+
+The arguments are:
+'line_name' - string, required Turn line to use
+'messages' - iterable, required message payloads
+'concurrency' - int, optional maximum number of requests in flight (default: 10)
+'session_windows' - SessionWindowIndex, optional index of the conversation windows of
+the contacts, from turnpy.session_window
+'fallback_template' - string, optional template to send to contacts outside their
+window instead, once per contact; without one they are skipped
+'language' - string, optional language code for the fallback template (default: 'en')
+'fallback_header_params' - list, optional header parameters of the fallback template
+'fallback_body_params' - list, optional body parameters of the fallback template
+'scheduler' - RequestScheduler, optional scheduler to queue the sends on with BULK
+priority, so conversational replies on the same scheduler go first
+
+Messages to the same contact, e.g. the parts of a lesson, are sent one at a time in
+the order of 'messages', while different contacts are sent to concurrently. Up to
+BULK_READ_AHEAD times 'concurrency' messages are read ahead, so the parts waiting for
+their turn do not hold up other contacts.
+
+Contacts outside their window are handled locally, without a request to Turn. Yields
+(msisdn, response) pairs as sends complete; a failed send yields the exception instead
+of a response, and a skipped message a SessionWindowClosedError.
+"""
+
+BULK_READ_AHEAD = 4
+
+
+async def send_message_bulk(
+    line_name: str,
+    messages: Iterable[dict],
+    concurrency: int = 10,
+    session_windows: SessionWindowIndex = None,
+    fallback_template: str = None,
+    language: str = "en",
+    fallback_header_params: list = None,
+    fallback_body_params: list = None,
+    client: httpx.AsyncClient = None,
+    scheduler: RequestScheduler = None,
+) -> AsyncIterator[tuple]:
+    router = SessionWindowRouter(
+        session_windows,
+        fallback_template,
+        await template_namespace(line_name) if fallback_template else None,
+        fallback_header_params,
+        fallback_body_params,
+        language,
+    )
+    executor = KeyedSequentialExecutor()
+    sending = asyncio.Semaphore(concurrency)
+
+    async def send_in_order(message_data):
+        message_data = router.route(message_data)
+        async with sending:
+            return await _respect_rate_limit(
+                lambda: send_message(line_name, message_data, client=client),
+                scheduler=scheduler,
+            )
+
+    async def send(message_data):
+        return await executor.submit(message_data["to"], send_in_order, message_data)
+
+    async for message_data, outcome in _run_bulk(
+        messages, send, concurrency * BULK_READ_AHEAD
+    ):
+        logger.debug(f"Bulk message to {message_data['to']}: {outcome}")
+        yield message_data["to"], outcome
+
+
+"""
+Start a journey for every msisdn of a cohort, e.g. to enrol a whole class in a Stack.
+
+The token is read for every contact, so a token rotated during a long run is picked
+up, while the auth headers are cached per token and the requests share the pooled
+connections of the client. Pass a scheduler to queue the requests on it with BULK
+priority. Yields (msisdn, response) pairs as journeys are started; a failed request
+yields the exception instead of a response.
+"""
+
+
+async def start_journey_bulk(
+    stack_uuid: str,
+    msisdns: Iterable[str],
+    line_name: str,
+    concurrency: int = 10,
+    client: httpx.AsyncClient = None,
+    scheduler: RequestScheduler = None,
+) -> AsyncIterator[tuple]:
     if not client:
         client = await turn_client.get_client()
 
-    response = await client.post(
-        f"stacks/{stack_uuid}/start",
-        headers=auth_headers,
-        json=journey_data,
+    async def start(msisdn):
+        turn_creds = await turn_credentials(line_name)
+        turn_request = core.start_journey_request(
+            msisdn, line_name, turn_creds, stack_uuid
+        )
+        return await _respect_rate_limit(
+            lambda: _request(turn_request, client=client), scheduler=scheduler
+        )
+
+    async for msisdn, outcome in _run_bulk(msisdns, start, concurrency):
+        logger.debug(f"Bulk started journey for {msisdn}: {outcome}")
+        yield msisdn, outcome
+
+
+"""
+Determine and release the claims on many contacts, e.g. to clean up after a broken Journey.
+
+The arguments are:
+'msisdns' - iterable, required contacts to release
+'line_name' - string, required Turn line to use
+'claim_uuid_prefix' - string, optional only release claims whose uuid starts with
+this, pass a full uuid to release a single claim
+'concurrency' - int, optional maximum number of contacts in flight (default: 10)
+'scheduler' - RequestScheduler, optional scheduler to queue the requests on with BULK
+priority
+
+Each contact's claim is determined and released in one pipelined step. The token is
+read for every contact, so a rotated token is picked up. Returns a summary with the msisdns that were 'released', 'skipped'
+because the claim did not match, 'unclaimed', or that 'failed'.
+"""
+
+
+async def release_claims_bulk(
+    msisdns: Iterable[str],
+    line_name: str,
+    claim_uuid_prefix: str = None,
+    concurrency: int = 10,
+    client: httpx.AsyncClient = None,
+    scheduler: RequestScheduler = None,
+) -> dict:
+    if not client:
+        client = await turn_client.get_client()
+
+    async def release(msisdn):
+        turn_creds = await turn_credentials(line_name)
+        determine = core.determine_claim_request(msisdn, line_name, turn_creds)
+        response = await _respect_rate_limit(
+            lambda: _request(determine, client=client), scheduler=scheduler
+        )
+        outcome, claim_uuid = core.parse_claim(
+            response.status_code, response.content, claim_uuid_prefix
+        )
+        if outcome != "release":
+            return outcome
+
+        release_request = core.release_claim_request(
+            msisdn, line_name, turn_creds, claim_uuid
+        )
+        response = await _respect_rate_limit(
+            lambda: _request(release_request, client=client), scheduler=scheduler
+        )
+        return "released" if response.status_code == 200 else "failed"
+
+    summary = {"released": [], "skipped": [], "unclaimed": [], "failed": []}
+    async for msisdn, outcome in _run_bulk(msisdns, release, concurrency):
+        if isinstance(outcome, Exception):
+            logger.warning(f"Failed to release claim for {msisdn}: {outcome}")
+            outcome = "failed"
+        summary[outcome].append(msisdn)
+
+    logger.info(
+        "Released claims: "
+        + ", ".join(f"{len(done)} {outcome}" for outcome, done in summary.items())
     )
-    logger.debug(f"Started journey response: {response.text}")
-    return response
+    return summary
@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+
+"""CIRCUIT BREAKER"""
+"""
+Fail fast while Turn is degraded instead of waiting on timeouts.
+
+Requests are grouped per key, which the clients set to the line name and endpoint.
+While a circuit is closed, its failures and successes are counted per window of
+'window' seconds, starting afresh when a window has passed. Once at least
+'minimum_requests' have been seen in the current window and the share of
+failures reaches 'failure_rate_threshold', the circuit opens and every request for that
+key raises a CircuitOpenError straight away, so callers can shed load or re-queue.
+After 'open_duration' seconds the circuit is half-open: up to 'half_open_probes'
+requests are let through. A successful probe closes the circuit again, a failed one
+re-opens it. A probe that ends without an outcome, e.g. because it was cancelled,
+gives its slot back with release_probe(), and a probe that is never reported back is
+given up on after 'open_duration' seconds.
+
+Failures are transport errors such as timeouts and 5xx responses. Other responses,
+including 4xx and 429 Too Many Requests, show that Turn is up and count as successes.
+"""
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, key: tuple, retry_after: float):
+        self.key = key
+        self.retry_after = retry_after
+        super().__init__(
+            f"Circuit for {key} is open, retry in {retry_after:.1f} seconds."
+        )
+
+
+class _Circuit:
+    def __init__(self):
+        self.state = CLOSED
+        self.successes = 0
+        self.failures = 0
+        self.window_start = time.monotonic()
+        self.opened_at = 0.0
+        self.probes = 0
+        self.probe_started = 0.0
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        failure_rate_threshold: float = 0.5,
+        minimum_requests: int = 20,
+        window: float = 30.0,
+        open_duration: float = 30.0,
+        half_open_probes: int = 1,
+    ):
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_requests = minimum_requests
+        self.window = window
+        self.open_duration = open_duration
+        self.half_open_probes = half_open_probes
+
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def state(self, key: tuple) -> str:
+        circuit = self._circuits.get(key)
+        return circuit.state if circuit else CLOSED
+
+    """
+    Raise a CircuitOpenError if a request for the key may not go out right now.
+    """
+
+    def before_request(self, key: tuple) -> None:
+        with self._lock:
+            circuit = self._circuits.setdefault(key, _Circuit())
+            if circuit.state == CLOSED:
+                return
+
+            now = time.monotonic()
+            if circuit.state == OPEN:
+                retry_after = circuit.opened_at + self.open_duration - now
+                if retry_after > 0:
+                    raise CircuitOpenError(key, retry_after)
+                circuit.state = HALF_OPEN
+                circuit.probes = 0
+                logger.info(f"Circuit for {key} is half-open, probing Turn")
+
+            if circuit.probes >= self.half_open_probes:
+                retry_after = circuit.probe_started + self.open_duration - now
+                if retry_after > 0:
+                    raise CircuitOpenError(key, retry_after)
+                logger.warning(f"Gave up on the probes for {key}, probing again")
+                circuit.probes = 0
+            circuit.probes += 1
+            circuit.probe_started = now
+
+    """
+    Give back the probe slot of a request that ended without a response or a transport
+    error, e.g. because it was cancelled, without counting it either way.
+    """
+
+    def release_probe(self, key: tuple) -> None:
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is not None and circuit.state == HALF_OPEN and circuit.probes:
+                circuit.probes -= 1
+
+    def record_success(self, key: tuple) -> None:
+        with self._lock:
+            circuit = self._circuits.setdefault(key, _Circuit())
+            if circuit.state == HALF_OPEN:
+                logger.info(f"Circuit for {key} is closed again")
+                self._circuits[key] = _Circuit()
+                return
+            self._roll_window(circuit)
+            circuit.successes += 1
+
+    def record_failure(self, key: tuple) -> None:
+        with self._lock:
+            circuit = self._circuits.setdefault(key, _Circuit())
+            if circuit.state == HALF_OPEN:
+                self._open(key, circuit)
+                return
+            if circuit.state == OPEN:
+                return
+
+            self._roll_window(circuit)
+            circuit.failures += 1
+            total = circuit.failures + circuit.successes
+            if (
+                total >= self.minimum_requests
+                and circuit.failures / total >= self.failure_rate_threshold
+            ):
+                self._open(key, circuit)
+
+    def _roll_window(self, circuit: _Circuit) -> None:
+        now = time.monotonic()
+        if now - circuit.window_start > self.window:
+            circuit.successes = 0
+            circuit.failures = 0
+            circuit.window_start = now
+
+    def _open(self, key: tuple, circuit: _Circuit) -> None:
+        circuit.state = OPEN
+        circuit.opened_at = time.monotonic()
+        logger.warning(
+            f"Circuit for {key} is open after {circuit.failures} failures, "
+            f"failing fast for {self.open_duration} seconds"
+        )
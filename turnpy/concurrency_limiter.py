@@ -0,0 +1,211 @@
+import asyncio
+import collections
+import logging
+import threading
+import time
+
+"""CONCURRENCY LIMITER"""
+"""
+Tune the number of requests in flight per Turn line to what Turn can take right now.
+
+A fixed concurrency is either too low, leaving throughput unused, or too high, running
+into 429 Too Many Requests and timeouts. The limiter adjusts the limit of each line
+with AIMD, additive increase and multiplicative decrease, like TCP congestion control:
+
+- every response that arrives without a sign of congestion raises the limit by about
+  'increase' per round of 'limit' responses, up to 'max_limit'
+- a 429 or 5xx response, a transport error such as a timeout, or a recent latency
+  above 'latency_tolerance' times the baseline latency multiplies the limit by
+  'decrease_factor', down to 'min_limit'. Requests started before the last decrease
+  do not decrease it again, so one burst of errors only halves the limit once.
+
+Single slow responses are normal network jitter, so latency is compared gradient
+style: the recent latency is a moving average over about 'short_window' responses,
+and the baseline a moving average over about 'long_window' responses, which follows
+Turn when it gets slower for good. A queue building up at Turn raises the recent
+latency well before the baseline. Both are kept per endpoint of the line, as a media
+upload is naturally much slower than a text message and must not be taken for
+congestion, while the limit itself is shared by all endpoints of a line.
+
+Give the limiter to the async client, so requests wait for a free slot on their line
+before they are sent. The bulk senders can then be given a generous concurrency and
+let the limiter find the right one. The current limits are exposed as metrics:
+
+limiter = AdaptiveConcurrencyLimiter(initial_limit=10, max_limit=100)
+turn_client = AsyncTurnClient(concurrency_limiter=limiter)
+limiter.limit("turn_line_1")  # e.g. 37
+limiter.metrics()  # {"turn_line_1": {"limit": 37, "in_flight": 12, ...}}
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class _LineLimit:
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiters = collections.deque()
+        self.latencies = {}
+        self.last_decrease = 0.0
+
+
+class _Latency:
+    def __init__(self):
+        self.samples = 0
+        self.recent = 0.0
+        self.baseline = 0.0
+
+
+class AdaptiveConcurrencyLimiter:
+    def __init__(
+        self,
+        initial_limit: int = 10,
+        min_limit: int = 1,
+        max_limit: int = 100,
+        increase: float = 1.0,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+        short_window: int = 10,
+        long_window: int = 200,
+    ):
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError(
+                "Concurrency limits must satisfy 1 <= min <= initial <= max."
+            )
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.short_window = short_window
+        self.long_window = long_window
+        # Smoothing factors of exponential moving averages over about that many samples
+        self._short_weight = 2 / (short_window + 1)
+        self._long_weight = 2 / (long_window + 1)
+
+        self._lines = {}
+        self._lock = threading.Lock()
+
+    def _line(self, line_name: str) -> _LineLimit:
+        line = self._lines.get(line_name)
+        if line is None:
+            line = self._lines.setdefault(
+                line_name, _LineLimit(float(self.initial_limit))
+            )
+        return line
+
+    def limit(self, line_name: str) -> int:
+        with self._lock:
+            return int(self._line(line_name).limit)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                line_name: {
+                    "limit": int(line.limit),
+                    "in_flight": line.in_flight,
+                    "waiting": len(line.waiters),
+                    "latency": {
+                        endpoint: latency.recent
+                        for endpoint, latency in line.latencies.items()
+                    },
+                    "baseline_latency": {
+                        endpoint: latency.baseline
+                        for endpoint, latency in line.latencies.items()
+                    },
+                }
+                for line_name, line in self._lines.items()
+            }
+
+    """
+    Wait for a free slot on the line. Returns the start time of the request, to pass
+    to release() together with its outcome.
+    """
+
+    async def acquire(self, line_name: str) -> float:
+        with self._lock:
+            line = self._line(line_name)
+            if line.in_flight < int(line.limit) and not line.waiters:
+                line.in_flight += 1
+                return time.monotonic()
+            waiter = asyncio.get_running_loop().create_future()
+            line.waiters.append(waiter)
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in line.waiters:
+                    line.waiters.remove(waiter)
+                else:
+                    # The slot was already handed to this waiter, pass it on
+                    line.in_flight -= 1
+                    self._wake(line)
+            raise
+        return time.monotonic()
+
+    """
+    Free the slot of a request and adjust the limit of the line to its outcome: the
+    'status_code' of the response, or 'failed' for a transport error. A request that
+    ended without either, e.g. because it was cancelled, only frees its slot. The
+    latency of a response counts towards the recent latency of its 'endpoint'.
+    """
+
+    def release(
+        self,
+        line_name: str,
+        started: float,
+        status_code: int = None,
+        failed: bool = False,
+        endpoint: str = None,
+    ) -> None:
+        now = time.monotonic()
+        with self._lock:
+            line = self._line(line_name)
+            line.in_flight -= 1
+
+            if failed or status_code == 429 or (status_code or 0) >= 500:
+                self._decrease(line_name, line, started, now)
+            elif status_code is not None:
+                latency = line.latencies.get(endpoint)
+                if latency is None:
+                    latency = line.latencies[endpoint] = _Latency()
+                # Plain averages until there are enough samples for the moving ones
+                latency.samples += 1
+                short_weight = max(self._short_weight, 1 / latency.samples)
+                long_weight = max(self._long_weight, 1 / latency.samples)
+                latency.recent += short_weight * (now - started - latency.recent)
+                latency.baseline += long_weight * (now - started - latency.baseline)
+                if (
+                    latency.samples >= self.short_window
+                    and latency.recent > latency.baseline * self.latency_tolerance
+                ):
+                    self._decrease(line_name, line, started, now)
+                else:
+                    line.limit = min(
+                        line.limit + self.increase / line.limit, float(self.max_limit)
+                    )
+            self._wake(line)
+
+    def _decrease(
+        self, line_name: str, line: _LineLimit, started: float, now: float
+    ) -> None:
+        if started < line.last_decrease:
+            return
+        line.limit = max(line.limit * self.decrease_factor, float(self.min_limit))
+        line.last_decrease = now
+        logger.info(
+            f"Reduced the concurrency limit of {line_name} to {int(line.limit)}"
+        )
+
+    def _wake(self, line: _LineLimit) -> None:
+        while line.in_flight < int(line.limit) and line.waiters:
+            waiter = line.waiters.popleft()
+            line.in_flight += 1
+            waiter.get_loop().call_soon_threadsafe(_set_result, waiter)
+
+
+def _set_result(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
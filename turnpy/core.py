@@ -0,0 +1,261 @@
+import json
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Union
+
+"""CORE"""
+"""
+Build the requests sent to Turn and interpret its responses, without doing any I/O.
+
+Every Turn API call is described once here, as a TurnRequest with its method, path,
+headers and encoded body. The sync and async integrators only add credentials, send
+the request with their HTTP stack and hand back the response, so a change to an
+endpoint, the encoding or the handling of a response is made once for both.
+
+JSON bodies are encoded here, compactly. A message payload that is already bytes, e.g.
+encoded once ahead of a campaign with encode_json(), is sent as is. The auth headers
+are cached per token, so a bulk run builds them once. As they are shared by every
+request with the same token, they are read-only: copy them with dict() to change them.
+"""
+
+BASE_URL = "https://whatsapp.turn.io/v1"
+V1_ACCEPT = "application/vnd.v1+json"
+
+
+"""
+A request to Turn. The 'path' is relative to BASE_URL and the 'endpoint' is the path
+without its parameters, e.g. 'contacts/{msisdn}/claim', which together with the line
+name keys the circuit breaker.
+"""
+
+
+class TurnRequest(NamedTuple):
+    line_name: str
+    method: str
+    path: str
+    endpoint: str
+    headers: Mapping[str, str]
+    body: bytes = None
+
+
+def encode_json(data: Union[dict, bytes]) -> bytes:
+    if isinstance(data, bytes):
+        return data
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+@lru_cache(maxsize=128)
+def _auth_headers(token: str, accept: str, content_type: str) -> Mapping[str, str]:
+    headers = {"Authorization": f"Bearer {token}"}
+    if accept:
+        headers["Accept"] = accept
+    if content_type:
+        headers["Content-Type"] = content_type
+    return MappingProxyType(headers)
+
+
+def build_request(
+    line_name: str,
+    token: str,
+    method: str,
+    path: str,
+    endpoint: str = None,
+    data: Union[dict, bytes] = None,
+    accept: str = V1_ACCEPT,
+) -> TurnRequest:
+    body = None if data is None else encode_json(data)
+    return TurnRequest(
+        line_name,
+        method,
+        path,
+        endpoint or path,
+        _auth_headers(token, accept, "application/json" if body else None),
+        body,
+    )
+
+
+"""CONTACTS"""
+
+
+def obtain_contact_profile_request(
+    msisdn: str, line_name: str, token: str
+) -> TurnRequest:
+    return build_request(
+        line_name,
+        token,
+        "GET",
+        f"contacts/{msisdn}/profile",
+        endpoint="contacts/{msisdn}/profile",
+    )
+
+
+def update_contact_profile_request(
+    msisdn: str, line_name: str, token: str, profile_data: dict
+) -> TurnRequest:
+    return build_request(
+        line_name,
+        token,
+        "PATCH",
+        f"contacts/{msisdn}/profile",
+        endpoint="contacts/{msisdn}/profile",
+        data=profile_data,
+    )
+
+
+"""MESSAGES"""
+
+
+def send_message_request(
+    line_name: str, token: str, message_data: Union[dict, bytes]
+) -> TurnRequest:
+    return build_request(
+        line_name, token, "POST", "messages", data=message_data, accept=None
+    )
+
+
+"""MEDIA"""
+
+
+def save_media_request(
+    line_name: str, token: str, media_type: str, file_binary: bytes
+) -> TurnRequest:
+    return TurnRequest(
+        line_name,
+        "POST",
+        "media",
+        "media",
+        _auth_headers(token, None, media_type),
+        file_binary,
+    )
+
+
+"""CLAIMS"""
+
+
+def determine_claim_request(msisdn: str, line_name: str, token: str) -> TurnRequest:
+    return build_request(
+        line_name,
+        token,
+        "GET",
+        f"contacts/{msisdn}/claim",
+        endpoint="contacts/{msisdn}/claim",
+    )
+
+
+def release_claim_request(
+    msisdn: str, line_name: str, token: str, claim_uuid: str
+) -> TurnRequest:
+    return build_request(
+        line_name,
+        token,
+        "DELETE",
+        f"contacts/{msisdn}/claim",
+        endpoint="contacts/{msisdn}/claim",
+        data={"claim_uuid": claim_uuid},
+    )
+
+
+"""
+Decide what to do with the response to determine_claim_request when releasing claims
+in bulk. Returns the outcome, 'release', 'unclaimed', 'skipped' or 'failed', and the
+uuid of the claim to release.
+"""
+
+
+def parse_claim(status_code: int, body: bytes, claim_uuid_prefix: str = None) -> tuple:
+    if status_code == 404:
+        return "unclaimed", None
+    if status_code != 200:
+        return "failed", None
+
+    claim_uuid = json.loads(body).get("uuid")
+    if not claim_uuid:
+        return "unclaimed", None
+    if claim_uuid_prefix and not claim_uuid.startswith(claim_uuid_prefix):
+        return "skipped", claim_uuid
+    return "release", claim_uuid
+
+
+"""JOURNEYS"""
+
+
+def start_journey_request(
+    msisdn: str, line_name: str, token: str, stack_uuid: str
+) -> TurnRequest:
+    return build_request(
+        line_name,
+        token,
+        "POST",
+        f"stacks/{stack_uuid}/start",
+        endpoint="stacks/{stack_uuid}/start",
+        data={"wa_id": msisdn},
+    )
+
+
+"""RESPONSES"""
+"""
+Whether a response counts as a failure of Turn for the circuit breaker, rather than a
+problem with the request.
+"""
+
+
+def is_server_failure(status_code: int) -> bool:
+    return status_code >= 500
+
+
+"""
+Keep the circuit breaker of a client informed about a request, as a context manager
+around sending it, so the integrators only do the I/O:
+
+with core.CircuitOutcome(circuit_breaker, turn_request, httpx.HTTPError) as outcome:
+    response = await client.request(...)
+    outcome.response(response.status_code)
+
+On entry the breaker may raise a CircuitOpenError instead of letting the request go.
+On exit a 5xx response or one of the 'transport_errors' counts as a failure of Turn
+and any other response as a success, while a request that ended without either, e.g.
+because it was cancelled, gives back its half-open probe. Without a circuit breaker
+it does nothing.
+"""
+
+
+class CircuitOutcome:
+    def __init__(self, circuit_breaker, turn_request: TurnRequest, transport_errors):
+        self.circuit_breaker = circuit_breaker
+        self.key = (turn_request.line_name, turn_request.endpoint)
+        self.transport_errors = transport_errors
+        self.status_code = None
+
+    def response(self, status_code: int) -> None:
+        self.status_code = status_code
+
+    def __enter__(self):
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.before_request(self.key)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.circuit_breaker is None:
+            return
+        if self.status_code is not None:
+            if is_server_failure(self.status_code):
+                self.circuit_breaker.record_failure(self.key)
+            else:
+                self.circuit_breaker.record_success(self.key)
+        elif exc_type is not None and issubclass(exc_type, self.transport_errors):
+            self.circuit_breaker.record_failure(self.key)
+        else:
+            self.circuit_breaker.release_probe(self.key)
+
+
+"""
+How long to wait before retrying a request rejected with 429 Too Many Requests,
+following the Retry-After header and falling back to one second.
+"""
+
+
+def retry_after(headers) -> float:
+    try:
+        return max(float(headers.get("Retry-After", 1.0)), 0.0)
+    except ValueError:
+        return 1.0
@@ -0,0 +1,346 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable
+
+"""CREDENTIALS"""
+"""
+Load the Turn line credentials, track their expiry and rotate them before they run out.
+
+Every line has a 'token', a 'template_namespace' and an 'expiry', stored exactly as
+shown in Turn, so in the format "Apr 2, 2030 1:16 PM".
+"""
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_FORMAT = "%b %d, %Y %I:%M %p"
+
+
+def parse_expiry(expiry: str) -> datetime:
+    return datetime.strptime(expiry, EXPIRY_FORMAT)
+
+
+def format_expiry(expiry: datetime) -> str:
+    return expiry.strftime(EXPIRY_FORMAT)
+
+
+"""
+Return the token of a line config, or raise a ValueError if it has expired.
+"""
+
+
+def check_expiry(config_json: dict) -> str:
+    if parse_expiry(config_json["expiry"]) > datetime.now():
+        return config_json["token"]
+    else:
+        raise ValueError("API key has expired for this Turn line.")
+
+
+"""PROVIDERS"""
+"""
+Credential providers supply the config of the Turn lines to the clients.
+
+A provider implements load(), returning the whole config in the turn_config.json
+layout: {"lines": {"line_name": {"token": ..., "template_namespace": ..., "expiry": ...}}}.
+line_config() and token() are derived from it, but may be overridden when a line can
+be looked up more cheaply on its own. line_key() maps a line name to its key in the
+loaded config, for providers whose keys are normalised, so that wrapping providers
+look lines up the same way.
+"""
+
+
+class CredentialProvider:
+    def load(self) -> dict:
+        raise NotImplementedError
+
+    def line_key(self, line_name: str) -> str:
+        return line_name
+
+    def line_config(self, line_name: str) -> dict:
+        return self.load()["lines"][self.line_key(line_name)]
+
+    def token(self, line_name: str) -> str:
+        return check_expiry(self.line_config(line_name))
+
+
+"""
+Read the config from a JSON file, on every call. Wrap in a CachingCredentialProvider
+to read it only once.
+"""
+
+
+class FileCredentialProvider(CredentialProvider):
+    def __init__(self, file_name: str = "turn_config.json"):
+        self.file_name = file_name
+
+    def load(self) -> dict:
+        with open(self.file_name, "r") as file:
+            return json.load(file)
+
+
+"""
+Read the config from environment variables, e.g. for containers with injected secrets.
+
+Each line is configured with three variables named after the line in upper case:
+TURN_<LINE_NAME>_TOKEN, TURN_<LINE_NAME>_TEMPLATE_NAMESPACE and TURN_<LINE_NAME>_EXPIRY.
+The line names reported by load() are the lower case form, and lines are looked up
+case insensitively. Other variables with the prefix, e.g. an unrelated
+TURN_SERVER_TOKEN, are skipped by load() when the other two variables are missing.
+"""
+
+
+class EnvCredentialProvider(CredentialProvider):
+    FIELDS = ("token", "template_namespace", "expiry")
+
+    def __init__(self, prefix: str = "TURN_", environ: dict = None):
+        self.prefix = prefix
+        self.environ = os.environ if environ is None else environ
+
+    def _variable(self, line_name: str, field: str) -> str:
+        return f"{self.prefix}{line_name.upper()}_{field.upper()}"
+
+    def line_key(self, line_name: str) -> str:
+        return line_name.lower()
+
+    def line_config(self, line_name: str) -> dict:
+        try:
+            return {
+                field: self.environ[self._variable(line_name, field)]
+                for field in self.FIELDS
+            }
+        except KeyError as error:
+            raise KeyError(f"Missing credential variable {error} for Turn line.")
+
+    def load(self) -> dict:
+        suffix = "_TOKEN"
+        lines = {}
+        for variable in self.environ:
+            if not (variable.startswith(self.prefix) and variable.endswith(suffix)):
+                continue
+            line_name = self.line_key(variable[len(self.prefix) : -len(suffix)])
+            try:
+                lines[line_name] = self.line_config(line_name)
+            except KeyError as error:
+                logger.debug(f"Skipped incomplete Turn line {line_name}: {error}")
+        return {"lines": lines}
+
+
+"""
+Serve the config from a dictionary held in memory.
+"""
+
+
+class DictCredentialProvider(CredentialProvider):
+    def __init__(self, config: dict):
+        self.config = config
+
+    def load(self) -> dict:
+        return self.config
+
+
+"""
+Cache the config of another provider, so it is only loaded once.
+
+With a 'ttl' in seconds the config is reloaded once it is older than that, which
+picks up tokens rotated outside the process. invalidate() forces a reload on the
+next call.
+"""
+
+
+class CachingCredentialProvider(CredentialProvider):
+    def __init__(self, provider: CredentialProvider, ttl: float = None):
+        self.provider = provider
+        self.ttl = ttl
+        self._config = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def line_key(self, line_name: str) -> str:
+        return self.provider.line_key(line_name)
+
+    def load(self) -> dict:
+        config = self._config
+        if config is None or (
+            self.ttl is not None and time.monotonic() - self._loaded_at > self.ttl
+        ):
+            with self._lock:
+                config = self._config = self.provider.load()
+                self._loaded_at = time.monotonic()
+        return config
+
+    def invalidate(self) -> None:
+        self._config = None
+
+
+"""MANAGER"""
+"""
+Keep the credentials of every Turn line in memory and refresh them ahead of expiry.
+
+The arguments are:
+'provider' - CredentialProvider, optional source of the config, loaded once
+(default: the turn_config.json file in the working directory)
+'refresh_callback' - callable, optional function taking the line name and its current
+config and returning a new config with a fresh 'token' and 'expiry'
+'refresh_before' - timedelta, optional time before expiry to start a background refresh
+'refresh_retry_interval' - float, optional minimum number of seconds between background
+refreshes per line, so a failing callback, or one returning a token that still expires
+soon, is not retried on every call (default: 60)
+'warn_before' - timedelta, optional time before expiry to start logging warnings
+'warn_interval' - float, optional minimum number of seconds between warnings per line
+'on_expiry_warning' - callable, optional hook called with the line name and the
+seconds left, e.g. to publish a metric
+
+Tokens are read from an immutable snapshot that is swapped in one assignment when a
+refresh completes, so coroutines and threads that are sending keep using the old,
+still valid token until the new one is in place and never wait on a refresh. Only a
+token that has already expired blocks the caller until it has been refreshed.
+"""
+
+
+class CredentialManager(CredentialProvider):
+    def __init__(
+        self,
+        provider: CredentialProvider = None,
+        refresh_callback: Callable[[str, dict], dict] = None,
+        refresh_before: timedelta = timedelta(days=1),
+        refresh_retry_interval: float = 60.0,
+        warn_before: timedelta = timedelta(days=7),
+        warn_interval: float = 3600.0,
+        on_expiry_warning: Callable[[str, float], None] = None,
+    ):
+        self.provider = provider or FileCredentialProvider()
+        self.refresh_callback = refresh_callback
+        self.refresh_before = refresh_before
+        self.refresh_retry_interval = refresh_retry_interval
+        self.warn_before = warn_before
+        self.warn_interval = warn_interval
+        self.on_expiry_warning = on_expiry_warning
+
+        self._lines = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = set()
+        self._last_refresh_attempt = {}
+        self._last_warning = {}
+
+    def load(self) -> dict:
+        if self._lines is None:
+            with self._lock:
+                if self._lines is None:
+                    turn_config = self.provider.load()
+                    self._lines = {
+                        line_name: self._snapshot(config)
+                        for line_name, config in turn_config["lines"].items()
+                    }
+        return {"lines": self._lines}
+
+    def line_key(self, line_name: str) -> str:
+        return self.provider.line_key(line_name)
+
+    @staticmethod
+    def _snapshot(config: dict) -> dict:
+        snapshot = dict(config)
+        snapshot["expires_at"] = parse_expiry(config["expiry"])
+        return snapshot
+
+    def seconds_until_expiry(self, line_name: str) -> float:
+        expires_at = self.line_config(line_name)["expires_at"]
+        return (expires_at - datetime.now()).total_seconds()
+
+    """
+    Seconds left before the token of every line expires, for publishing as metrics.
+    """
+
+    def expiry_metrics(self) -> dict:
+        return {
+            line_name: self.seconds_until_expiry(line_name)
+            for line_name in self.load()["lines"]
+        }
+
+    def token(self, line_name: str) -> str:
+        line_name = self.line_key(line_name)
+        remaining = self.seconds_until_expiry(line_name)
+
+        if remaining <= 0:
+            if not self.refresh_callback:
+                raise ValueError("API key has expired for this Turn line.")
+            self.refresh(line_name)
+            remaining = self.seconds_until_expiry(line_name)
+            if remaining <= 0:
+                raise ValueError("API key has expired for this Turn line.")
+
+        elif remaining <= self.refresh_before.total_seconds() and self.refresh_callback:
+            self._refresh_in_background(line_name)
+
+        if remaining <= self.warn_before.total_seconds():
+            self._warn(line_name, remaining)
+
+        return self.line_config(line_name)["token"]
+
+    """
+    Rotate the token of a line with the refresh callback and swap it in atomically.
+
+    Concurrent refreshes of the same line are collapsed into one.
+    """
+
+    def refresh(self, line_name: str) -> dict:
+        line_name = self.line_key(line_name)
+        current = self.line_config(line_name)
+        with self._refresh_lock:
+            latest = self._lines[line_name]
+            if latest is not current and latest["expires_at"] > datetime.now():
+                return latest
+            new_config = self._snapshot(self.refresh_callback(line_name, dict(current)))
+            with self._lock:
+                lines = dict(self._lines)
+                lines[line_name] = new_config
+                self._lines = lines
+
+        logger.info(
+            f"Refreshed token for Turn line {line_name}, "
+            f"now valid until {new_config['expiry']}"
+        )
+        return new_config
+
+    def _refresh_in_background(self, line_name: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if line_name in self._refreshing:
+                return
+            last_attempt = self._last_refresh_attempt.get(line_name)
+            if (
+                last_attempt is not None
+                and now - last_attempt < self.refresh_retry_interval
+            ):
+                return
+            self._refreshing.add(line_name)
+            self._last_refresh_attempt[line_name] = now
+
+        def refresh():
+            try:
+                self.refresh(line_name)
+            except Exception:
+                logger.exception(f"Failed to refresh token for Turn line {line_name}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(line_name)
+
+        threading.Thread(
+            target=refresh, name=f"turnpy-refresh-{line_name}", daemon=True
+        ).start()
+
+    def _warn(self, line_name: str, remaining: float) -> None:
+        now = time.monotonic()
+        last_warning = self._last_warning.get(line_name)
+        if last_warning is not None and now - last_warning < self.warn_interval:
+            return
+        self._last_warning[line_name] = now
+
+        logger.warning(
+            f"API key for Turn line {line_name} expires in {remaining / 3600:.1f} hours."
+        )
+        if self.on_expiry_warning:
+            self.on_expiry_warning(line_name, remaining)
@@ -0,0 +1,7 @@
+"""
+Raised when a request is made through a Turn client that is draining for shutdown.
+"""
+
+
+class ClientClosedError(RuntimeError):
+    pass
@@ -0,0 +1,68 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable
+
+"""KEYED EXECUTOR"""
+"""
+Run coroutines one at a time per key, and concurrently across keys.
+
+Parts of a multi-part message sent to the same contact, e.g. a text, then an image,
+then an interactive message, must not race each other through the connection pool.
+Submitting them with the msisdn as the key runs them in the order of submission,
+while the parts for other contacts go out in parallel. A part that fails does not
+stop the parts after it.
+
+Only keys with work in flight or waiting are held, as the future of their latest
+submission, and a key is dropped as soon as its last submission finishes. Memory so
+grows with the number of contacts in flight, not with the number of contacts seen,
+which keeps it bounded over runs of hundreds of thousands of contacts.
+
+executor = KeyedSequentialExecutor()
+await asyncio.gather(
+    executor.submit("27820000000", send_text_message, "27820000000", line, "Part 1"),
+    executor.submit("27820000000", send_media_message, "27820000000", line, ...),
+)
+"""
+
+
+class KeyedSequentialExecutor:
+    def __init__(self):
+        self._tails = {}
+
+    def __len__(self) -> int:
+        return len(self._tails)
+
+    """
+    Run a call of a coroutine function after all earlier submissions for the same
+    key have finished, and return its result.
+
+    The arguments are:
+    'key' - hashable, required e.g. the msisdn of the recipient
+    'coroutine_function' - callable, required e.g. async_turn_integrator.send_message
+    Any other arguments are passed on to the coroutine function.
+    """
+
+    async def submit(
+        self,
+        key: Hashable,
+        coroutine_function: Callable[..., Awaitable],
+        *args,
+        **kwargs,
+    ):
+        previous = self._tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[key] = done
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            return await coroutine_function(*args, **kwargs)
+        finally:
+            if previous is None or previous.done():
+                self._release(key, done)
+            else:
+                # Cancelled while waiting: keep the order for the submissions after it
+                previous.add_done_callback(lambda _: self._release(key, done))
+
+    def _release(self, key: Hashable, done: asyncio.Future) -> None:
+        done.set_result(None)
+        if self._tails.get(key) is done:
+            del self._tails[key]
@@ -0,0 +1,164 @@
+"""MESSAGES"""
+
+"""
+Build the message payloads sent to the Turn messages endpoint.
+
+The builders are shared by the sync and async integrators and make no requests, so
+payloads can also be built and validated ahead of a campaign, see turnpy.validation.
+
+See documentation here: https://whatsapp.turn.io/docs/api/messages
+"""
+
+"""
+Build a text message.
+
+The recipient_type is currrently hardcoded to "individual" as there are no API docs pointing to
+another type of recipient.
+"""
+
+
+def build_text_message(msisdn: str, message: str) -> dict:
+    return {
+        "preview_url": False,
+        "recipient_type": "individual",
+        "to": f"{msisdn}",
+        "type": "text",
+        "text": {"body": message},
+    }
+
+
+def build_media_message(
+    msisdn: str,
+    media_type: str,
+    media_id: str,
+    caption="",
+    message: str = "",
+) -> dict:
+    message_data = {
+        "to": msisdn,
+        "recipient_type": "individual",
+    }
+    if media_type == "audio":
+        message_data["type"] = "audio"
+        message_data["audio"] = {"id": media_id}
+
+    elif media_type == "document":
+        message_data["type"] = "document"
+        message_data["document"] = {"id": media_id, "caption": caption}
+
+    elif media_type == "image":
+        message_data["type"] = "image"
+        message_data["image"] = {"id": media_id, "caption": caption}
+
+    elif media_type == "sticker":
+        message_data["type"] = "sticker"
+        message_data["sticker"] = {"id": media_id}
+
+    elif media_type == "video":
+        message_data["type"] = "video"
+        message_data["video"] = {"id": media_id, "caption": caption}
+
+    if message:
+        message_data["text"] = {"body": message}
+
+    return message_data
+
+
+"""
+Build an interactive message with a dropdown or buttons.
+
+See send_interactive_message in the integrators for the attributes of 'sections'. The
+optional attributes may be left out.
+"""
+
+
+def build_interactive_message(
+    msisdn: str, interactive_type: str, sections: dict
+) -> dict:
+    message_data = {
+        "to": msisdn,
+        "type": "interactive",
+        "interactive": {
+            "type": interactive_type,
+            "body": {"text": sections.get("body_text")},
+            "action": {},
+        },
+    }
+
+    if sections.get("header_text"):
+        message_data["interactive"]["header"] = {
+            "type": "text",
+            "text": sections["header_text"],
+        }
+    elif sections.get("header_image"):
+        message_data["interactive"]["header"] = {
+            "type": "image",
+            "id": sections["header_image"],
+        }
+
+    if sections.get("footer_text"):
+        message_data["interactive"]["footer"] = {"text": sections["footer_text"]}
+
+    if interactive_type == "button":
+        message_data["interactive"]["action"]["buttons"] = []
+        for button in sections.get("buttons", []):
+            message_data["interactive"]["action"]["buttons"].append(
+                {
+                    "type": "reply",
+                    "reply": {
+                        "id": button.get("callback_id"),
+                        "title": button.get("text"),
+                    },
+                }
+            )
+
+    if interactive_type == "list":
+        message_data["interactive"]["action"]["button"] = sections.get("list_button")
+        message_data["interactive"]["action"]["sections"] = []
+        message_data["interactive"]["action"]["sections"].append({})
+        message_data["interactive"]["action"]["sections"][0]["title"] = sections.get(
+            "list_title"
+        )
+        message_data["interactive"]["action"]["sections"][0]["rows"] = []
+        for list_item in sections.get("list_items", []):
+            message_data["interactive"]["action"]["sections"][0]["rows"].append(
+                {"id": list_item.get("callback_id"), "title": list_item.get("text")}
+            )
+
+    return message_data
+
+
+def build_template_message(
+    msisdn: str,
+    template_namespace: str,
+    template_name: str,
+    header_params: list = None,
+    body_params: list = None,
+    language: str = "en",
+) -> dict:
+    message_data = {
+        "to": msisdn,
+        "type": "template",
+        "template": {
+            "namespace": template_namespace,
+            "name": template_name,
+            "language": {"code": language, "policy": "deterministic"},
+            "components": [],
+        },
+    }
+
+    if header_params:
+        header_component = {
+            "type": "header",
+            "parameters": [{"type": "text", "text": param} for param in header_params],
+        }
+        message_data["template"]["components"].append(header_component)
+
+    if body_params:
+        body_component = {
+            "type": "body",
+            "parameters": [{"type": "text", "text": param} for param in body_params],
+        }
+        message_data["template"]["components"].append(body_component)
+
+    return message_data
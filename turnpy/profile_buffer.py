@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING
+
+from turnpy import async_turn_integrator, core
+
+if TYPE_CHECKING:
+    import httpx
+
+"""PROFILE UPDATES"""
+"""
+Buffer contact profile updates and send them to Turn in coalesced batches.
+
+Attribute syncs often change several fields of the same contact within a short time.
+Instead of a PATCH per change, the buffer merges the pending fields per msisdn, later
+values winning, and flushes them all concurrently once the window has passed since
+the first pending update. Use it as an async context manager, or call close(), so the
+remaining updates are flushed on shutdown. The buffer registers itself with the
+turn_client passed in, by default the one of async_turn_integrator at the time the
+buffer is created, so draining that client flushes it too.
+
+Updates that fail when the window flushes them are not lost: those that failed on a
+transport error, a 429 or a 5xx response go back into the buffer, under any newer
+values for the same contact, to be retried in the next window, and the others are
+counted in 'failed'. drain() reports both these and the failures of its last flush.
+
+async with ProfileUpdateBuffer("turn_line_1", window=30.0) as buffer:
+    buffer.update("27820000000", {"chat_per_week": "1"})
+    buffer.update("27820000000", {"school": "Hillside"})
+
+The arguments are:
+'line_name' - string, required Turn line to use
+'window' - float, optional seconds to collect updates before flushing (default: 60)
+'concurrency' - int, optional maximum number of PATCH requests in flight (default: 10)
+'client' - httpx.AsyncClient, optional client to use instead of the pooled turn_client
+'turn_client' - AsyncTurnClient, optional client to register with for draining
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileUpdateBuffer:
+    def __init__(
+        self,
+        line_name: str,
+        window: float = 60.0,
+        concurrency: int = 10,
+        client: httpx.AsyncClient = None,
+        turn_client: async_turn_integrator.AsyncTurnClient = None,
+    ):
+        self.line_name = line_name
+        self.window = window
+        self.concurrency = concurrency
+        self.client = client
+        self.failed = 0
+
+        self._pending = {}
+        self._sending = []
+        self._timer = None
+        self._flushes = set()
+        self._closed = False
+        (turn_client or async_turn_integrator.turn_client).register(self)
+
+    def __len__(self) -> int:
+        return len(self._pending) + sum(len(batch) for batch in self._sending)
+
+    def update(self, msisdn: str, profile_data: dict) -> None:
+        if self._closed:
+            raise RuntimeError("Cannot update a closed profile update buffer.")
+
+        self._pending.setdefault(msisdn, {}).update(profile_data)
+        self._start_timer()
+
+    def _start_timer(self) -> None:
+        if self._timer is None and not self._closed:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.window, self._flush_in_background
+            )
+
+    def _flush_in_background(self) -> None:
+        self._timer = None
+        flush = asyncio.ensure_future(self._flush_window())
+        self._flushes.add(flush)
+        flush.add_done_callback(self._flushes.discard)
+
+    async def _flush_window(self) -> None:
+        pending, self._pending = self._pending, {}
+        results = await self._send(pending)
+        for msisdn, outcome in results.items():
+            if not _failed(outcome):
+                continue
+            if isinstance(outcome, Exception) or _retryable(outcome.status_code):
+                self._pending[msisdn] = {
+                    **pending[msisdn],
+                    **self._pending.get(msisdn, {}),
+                }
+            else:
+                self.failed += 1
+        if self._pending:
+            self._start_timer()
+
+    """
+    Send all pending updates now. Returns a dictionary of msisdn to response, or to the
+    exception raised for that msisdn.
+    """
+
+    async def flush(self) -> dict:
+        pending, self._pending = self._pending, {}
+        return await self._send(pending)
+
+    """
+    Send a batch of updates, counting those not sent yet in len(). If the flush is
+    cancelled, e.g. because a drain timed out, they go back into the buffer, so they
+    are reported as unflushed rather than lost.
+    """
+
+    async def _send(self, pending: dict) -> dict:
+        if not pending:
+            return {}
+
+        async def patch(msisdn):
+            return await async_turn_integrator._respect_rate_limit(
+                lambda: async_turn_integrator.update_contact_profile(
+                    msisdn, self.line_name, pending[msisdn], client=self.client
+                )
+            )
+
+        results = {}
+        unsent = dict(pending)
+        self._sending.append(unsent)
+        try:
+            async for msisdn, outcome in async_turn_integrator._run_bulk(
+                pending, patch, self.concurrency
+            ):
+                if _failed(outcome):
+                    logger.warning(
+                        f"Failed to update contact profile {msisdn}: {outcome}"
+                    )
+                del unsent[msisdn]
+                results[msisdn] = outcome
+        finally:
+            self._sending.remove(unsent)
+            for msisdn, profile_data in unsent.items():
+                self._pending[msisdn] = {
+                    **profile_data,
+                    **self._pending.get(msisdn, {}),
+                }
+
+        logger.debug(f"Flushed {len(pending)} contact profile updates")
+        return results
+
+    """
+    Stop the timer, wait for a flush of the window still in flight, then send all
+    pending updates, including those it put back for a retry.
+    """
+
+    async def close(self) -> dict:
+        self._closed = True
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._flushes:
+            await asyncio.gather(*self._flushes)
+        return await self.flush()
+
+    async def drain(self) -> int:
+        results = await self.close()
+        return self.failed + sum(1 for outcome in results.values() if _failed(outcome))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+def _failed(outcome) -> bool:
+    return isinstance(outcome, Exception) or outcome.status_code >= 400
+
+
+def _retryable(status_code: int) -> bool:
+    return status_code == 429 or core.is_server_failure(status_code)
@@ -0,0 +1,171 @@
+import csv
+import json
+import logging
+from typing import Iterable, Iterator
+
+"""RECIPIENTS"""
+"""
+Stream campaign recipients from CSV or JSONL exports.
+
+Every reader is a generator, so rows are read, validated and normalised one at a
+time and fed into the bulk senders without loading the file. The one exception is
+dropping duplicate recipients, which has to remember every msisdn seen: about 65 MB
+per million distinct recipients. Pass dedupe=False for exports that are known to be
+unique, to read a cohort of any size in constant memory.
+Each recipient is yielded as a dictionary ready for a bulk template send:
+{"msisdn": "27820000000", "header_params": [...], "body_params": [...]}
+"""
+
+logger = logging.getLogger(__name__)
+
+MIN_MSISDN_LENGTH = 8
+MAX_MSISDN_LENGTH = 15
+
+
+"""
+Normalise an msisdn to the digits-only WhatsApp ID format Turn expects.
+
+Spaces, dashes, dots and brackets are stripped, as is a leading '+' or '00'
+international prefix. If a 'default_country_code' is given, a national number
+starting with a single '0' has the '0' replaced by the country code. A ValueError
+is raised for anything that is not a plausible E.164 number.
+"""
+
+
+def normalise_msisdn(msisdn: str, default_country_code: str = None) -> str:
+    digits = str(msisdn).strip()
+    for character in " -.()":
+        digits = digits.replace(character, "")
+
+    if digits.startswith("+"):
+        digits = digits[1:]
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif digits.startswith("0") and default_country_code:
+        digits = default_country_code.lstrip("+") + digits[1:]
+
+    if not digits.isdigit() or digits.startswith("0"):
+        raise ValueError(f"Invalid msisdn: {msisdn!r}")
+    if not MIN_MSISDN_LENGTH <= len(digits) <= MAX_MSISDN_LENGTH:
+        raise ValueError(f"Invalid msisdn length: {msisdn!r}")
+
+    return digits
+
+
+"""
+Drop repeated recipients from a stream, keeping the first occurrence.
+
+Seen msisdns are stored as integers rather than strings, which takes about 65 MB per
+million distinct recipients, roughly half of what the strings would. Memory so grows
+with the size of the cohort.
+"""
+
+
+def dedupe_recipients(recipients: Iterable[dict]) -> Iterator[dict]:
+    seen = set()
+    for recipient in recipients:
+        key = int(recipient["msisdn"])
+        if key in seen:
+            logger.debug(f"Skipping duplicate recipient {recipient['msisdn']}")
+            continue
+        seen.add(key)
+        yield recipient
+
+
+def _normalise_recipients(
+    rows: Iterable[tuple], default_country_code: str = None
+) -> Iterator[dict]:
+    for line_number, row in rows:
+        try:
+            row["msisdn"] = normalise_msisdn(row["msisdn"], default_country_code)
+            params = row["header_params"] + row["body_params"]
+            if any(param is None for param in params):
+                raise ValueError("missing template parameter")
+        except (KeyError, TypeError, ValueError) as error:
+            logger.warning(f"Skipping recipient on line {line_number}: {error}")
+            continue
+        yield row
+
+
+"""
+Read recipients from a CSV file.
+
+The arguments are:
+'file_name' - string, required path to the CSV file, which must have a header row
+'msisdn_column' - string, optional name of the column holding the msisdn
+'header_columns' - list, optional columns used, in order, as template header params
+'body_columns' - list, optional columns used, in order, as template body params
+'default_country_code' - string, optional code used to normalise national numbers
+'dedupe' - bool, optional drop repeated msisdns, at the memory cost of
+dedupe_recipients (default: True)
+"""
+
+
+def read_csv_recipients(
+    file_name: str,
+    msisdn_column: str = "msisdn",
+    header_columns: list = None,
+    body_columns: list = None,
+    default_country_code: str = None,
+    dedupe: bool = True,
+) -> Iterator[dict]:
+    def rows():
+        with open(file_name, "r", newline="") as file:
+            for line_number, row in enumerate(csv.DictReader(file), start=2):
+                yield line_number, {
+                    "msisdn": row.get(msisdn_column),
+                    "header_params": [row[column] for column in header_columns or []],
+                    "body_params": [row[column] for column in body_columns or []],
+                }
+
+    recipients = _normalise_recipients(rows(), default_country_code)
+    yield from dedupe_recipients(recipients) if dedupe else recipients
+
+
+"""
+Read recipients from a JSONL file.
+
+Every line is a JSON object with an 'msisdn' and optional 'header_params' and
+'body_params' lists, named like the arguments of send_template_message. Blank
+lines and lines that are not a valid JSON object are skipped. Repeated msisdns are dropped
+unless 'dedupe' is False, as for CSV files.
+"""
+
+
+def read_jsonl_recipients(
+    file_name: str, default_country_code: str = None, dedupe: bool = True
+) -> Iterator[dict]:
+    def rows():
+        with open(file_name, "r") as file:
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as error:
+                    logger.warning(f"Skipping recipient on line {line_number}: {error}")
+                    continue
+                if not isinstance(record, dict):
+                    logger.warning(
+                        f"Skipping recipient on line {line_number}: not a JSON object"
+                    )
+                    continue
+                yield line_number, {
+                    "msisdn": record.get("msisdn"),
+                    "header_params": record.get("header_params") or [],
+                    "body_params": record.get("body_params") or [],
+                }
+
+    recipients = _normalise_recipients(rows(), default_country_code)
+    yield from dedupe_recipients(recipients) if dedupe else recipients
+
+
+"""
+Read recipients from a CSV or JSONL file, picking the reader from the file extension.
+"""
+
+
+def read_recipients(file_name: str, **kwargs) -> Iterator[dict]:
+    if file_name.endswith((".jsonl", ".ndjson")):
+        return read_jsonl_recipients(file_name, **kwargs)
+    return read_csv_recipients(file_name, **kwargs)
@@ -0,0 +1,155 @@
+import asyncio
+import itertools
+import logging
+import math
+from typing import Awaitable, Callable
+
+"""SCHEDULER"""
+"""
+Schedule outbound requests by priority and deadline in front of the async client.
+
+Conversational traffic, like an interactive message answering a button press, should
+not wait behind thousands of queued campaign messages. The scheduler runs a fixed
+number of workers that always take the most urgent request first: the lowest priority
+class, then the earliest deadline, then the order of submission. A request that is
+still queued when its deadline passes is dropped with a DeadlineExceededError instead
+of being sent late. The submitter gets the error as soon as the deadline passes, even
+while all workers are busy.
+
+async with RequestScheduler(concurrency=20) as scheduler:
+    await scheduler.submit(
+        send_interactive_message, msisdn, line_name, "button", sections,
+        priority=INTERACTIVE, deadline=2.0,
+    )
+"""
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+DEFAULT = 1
+BULK = 2
+
+
+class DeadlineExceededError(Exception):
+    pass
+
+
+class _Job:
+    __slots__ = ("call", "future", "started")
+
+    def __init__(self, call: Callable[[], Awaitable], future: asyncio.Future):
+        self.call = call
+        self.future = future
+        self.started = False
+
+
+class RequestScheduler:
+    def __init__(self, concurrency: int = 10):
+        if concurrency < 1:
+            raise ValueError("Scheduler concurrency must be at least 1.")
+        self.concurrency = concurrency
+        self.dropped = 0
+
+        self._queue = None
+        self._workers = []
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def _start(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        if not self._workers:
+            self._workers = [
+                asyncio.ensure_future(self._work()) for _ in range(self.concurrency)
+            ]
+
+    """
+    Queue a call of a coroutine function and wait for its result.
+
+    The arguments are:
+    'coroutine_function' - callable, required e.g. async_turn_integrator.send_message
+    'priority' - int, optional INTERACTIVE, DEFAULT or BULK (default: DEFAULT)
+    'deadline' - float, optional seconds from now by which the request must have been
+    started, after which it is dropped
+    Any other arguments are passed on to the coroutine function.
+    """
+
+    async def submit(
+        self,
+        coroutine_function: Callable[..., Awaitable],
+        *args,
+        priority: int = DEFAULT,
+        deadline: float = None,
+        **kwargs,
+    ):
+        self._start()
+        loop = asyncio.get_running_loop()
+        expires_at = loop.time() + deadline if deadline is not None else math.inf
+        job = _Job(lambda: coroutine_function(*args, **kwargs), loop.create_future())
+
+        await self._queue.put((priority, expires_at, next(self._sequence), job))
+        try:
+            if deadline is not None:
+                # Fail as soon as the deadline passes, not when a worker gets to it
+                await asyncio.wait({job.future}, timeout=max(deadline, 0))
+                if not job.future.done() and not job.started:
+                    self._drop(priority, job)
+            return await job.future
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+
+    def _drop(self, priority: int, job: _Job) -> None:
+        self.dropped += 1
+        logger.warning(f"Dropped a request with priority {priority} past its deadline")
+        job.future.set_exception(
+            DeadlineExceededError("Request deadline passed while queued.")
+        )
+
+    async def _work(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            priority, expires_at, _, job = await self._queue.get()
+            try:
+                if job.future.done():
+                    continue
+                if loop.time() > expires_at:
+                    self._drop(priority, job)
+                    continue
+
+                job.started = True
+                try:
+                    result = await job.call()
+                except Exception as error:
+                    if not job.future.done():
+                        job.future.set_exception(error)
+                else:
+                    if not job.future.done():
+                        job.future.set_result(result)
+            finally:
+                self._queue.task_done()
+
+    """
+    Wait for all queued requests to finish, then stop the workers. Register the
+    scheduler with the async turn_client to have this done when the client drains.
+    """
+
+    async def close(self) -> None:
+        if self._queue is not None:
+            await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def drain(self) -> int:
+        await self.close()
+        return 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
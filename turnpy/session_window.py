@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Union
+
+from turnpy.messages import build_template_message
+
+"""SESSION WINDOWS"""
+"""
+Track the 24 hour conversation window of each contact locally.
+
+WhatsApp only delivers free-form messages, like text, media and interactive messages,
+within 24 hours of the last message the contact sent. Outside that window only
+templates can be sent, and a free-form send costs a round trip just to fail at Turn.
+
+The index keeps the time of the last inbound message per contact. Feed it from
+inbound webhooks with record_webhook(), or from contact profiles obtained from Turn
+with record_profile(), and pass it to send_message_bulk, which then sends a template
+to the contacts outside their window, or skips them, without a request. The decision
+is made by a SessionWindowRouter, without any I/O, so the sync and async clients
+handle contacts the same way. Contacts are
+stored as integers, so millions fit comfortably; prune() drops the expired ones.
+
+The arguments are:
+'window' - float, optional length of the conversation window in seconds (default: 24 hours)
+'margin' - float, optional seconds before the end of the window from which a contact
+counts as outside of it, so a queued send does not arrive just too late (default: 60)
+'clock' - callable, optional returning the current unix time (default: time.time)
+"""
+
+logger = logging.getLogger(__name__)
+
+SESSION_WINDOW = 24 * 60 * 60
+
+
+class SessionWindowClosedError(Exception):
+    pass
+
+
+def _key(msisdn: str) -> int:
+    return int(str(msisdn).lstrip("+"))
+
+
+def _timestamp(value: Union[str, int, float]) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+class SessionWindowIndex:
+    def __init__(
+        self,
+        window: float = SESSION_WINDOW,
+        margin: float = 60.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.window = window
+        self.margin = margin
+        self.clock = clock
+        self._last_inbound = {}
+
+    def __len__(self) -> int:
+        return len(self._last_inbound)
+
+    def record_inbound(self, msisdn: str, timestamp=None) -> None:
+        timestamp = self.clock() if timestamp is None else _timestamp(timestamp)
+        key = _key(msisdn)
+        if timestamp > self._last_inbound.get(key, 0.0):
+            self._last_inbound[key] = timestamp
+
+    """
+    Record the inbound messages of a webhook payload from Turn, e.g.
+    {"messages": [{"from": "27820000000", "timestamp": "1700000000", ...}]}.
+    Status updates of outbound messages do not open a window and are ignored. Returns
+    the number of messages recorded.
+    """
+
+    def record_webhook(self, payload: dict) -> int:
+        messages = payload.get("messages") or []
+        for message in messages:
+            self.record_inbound(message["from"], message.get("timestamp"))
+        return len(messages)
+
+    """
+    Record the last inbound time from a contact profile, as returned by
+    obtain_contact_profile. The 'field' is the profile field holding it, as a unix
+    timestamp or an ISO 8601 date, and profiles without it are ignored.
+    """
+
+    def record_profile(
+        self, msisdn: str, profile: dict, field: str = "last_seen_at"
+    ) -> None:
+        last_seen = (profile.get("fields") or {}).get(field)
+        if last_seen:
+            self.record_inbound(msisdn, last_seen)
+
+    def last_inbound(self, msisdn: str) -> float:
+        return self._last_inbound.get(_key(msisdn))
+
+    def in_window(self, msisdn: str) -> bool:
+        last_inbound = self._last_inbound.get(_key(msisdn))
+        if last_inbound is None:
+            return False
+        return self.clock() < last_inbound + self.window - self.margin
+
+    def prune(self) -> int:
+        cutoff = self.clock() - self.window
+        expired = [key for key, last in self._last_inbound.items() if last <= cutoff]
+        for key in expired:
+            del self._last_inbound[key]
+        logger.debug(f"Pruned {len(expired)} expired session windows")
+        return len(expired)
+
+
+"""
+Decide what to send for each message of a bulk run, given the session windows.
+
+A message to a contact in their window is sent as it is. The first message to a
+contact outside their window is replaced by the fallback template, if there is one,
+with the same 'header_params' and 'body_params' for every contact, and any other
+message to them is skipped with a SessionWindowClosedError. The 'namespace' of the
+template is looked up by the caller. route() is safe to call from several threads.
+"""
+
+
+class SessionWindowRouter:
+    def __init__(
+        self,
+        session_windows: SessionWindowIndex = None,
+        fallback_template: str = None,
+        namespace: str = None,
+        header_params: list = None,
+        body_params: list = None,
+        language: str = "en",
+    ):
+        self.session_windows = session_windows
+        self.fallback_template = fallback_template
+        self.namespace = namespace
+        self.header_params = header_params
+        self.body_params = body_params
+        self.language = language
+
+        self._fallback_sent = set()
+        self._lock = threading.Lock()
+
+    def route(self, message_data: dict) -> dict:
+        msisdn = message_data["to"]
+        if self.session_windows is None or self.session_windows.in_window(msisdn):
+            return message_data
+
+        key = _key(msisdn)
+        with self._lock:
+            first_fallback = key not in self._fallback_sent
+            self._fallback_sent.add(key)
+        if self.fallback_template is None or not first_fallback:
+            raise SessionWindowClosedError(
+                f"{msisdn} is outside the conversation window."
+            )
+        return build_template_message(
+            msisdn,
+            self.namespace,
+            self.fallback_template,
+            self.header_params,
+            self.body_params,
+            self.language,
+        )
@@ -0,0 +1,229 @@
+import asyncio
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+import httpx
+
+"""TRANSPORTS"""
+"""
+Transports to load test against instead of Turn, without network access.
+
+Pass a transport to either client, e.g. AsyncTurnClient(transport=NullTransport()) or
+TurnClient(transport=ReplayTransport("turn_recording.jsonl")). They are httpx
+transports, which the sync client wraps in a requests adapter.
+
+NullTransport answers every request with a synthetic response shaped like Turn's,
+with an optional latency and error rate. RecordingTransport passes requests on to
+Turn and appends every exchange to a JSONL file, which ReplayTransport serves back from
+memory. Requests are matched to recorded responses by method and endpoint, where path
+segments holding msisdns or uuids are wildcards, cycling through the responses
+recorded for each endpoint.
+"""
+
+_PARAMETER_SEGMENT = re.compile(r"^\+?[0-9]+$|^[0-9a-fA-F-]{32,36}$")
+
+
+def endpoint_key(method: str, path: str) -> str:
+    segments = path.split("/v1/", 1)[-1].strip("/").split("/")
+    return (
+        method
+        + " "
+        + "/".join(
+            "*" if _PARAMETER_SEGMENT.match(segment) else segment
+            for segment in segments
+        )
+    )
+
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def _json_response(status_code: int, body: dict) -> httpx.Response:
+    return httpx.Response(
+        status_code, headers=_JSON_HEADERS, content=json.dumps(body).encode()
+    )
+
+
+"""
+Answer requests with synthetic, Turn shaped responses.
+
+The arguments are:
+'latency' - float, optional seconds every response takes (default: 0)
+'error_rate' - float, optional share of requests, between 0 and 1, answered with an error
+'error_status' - int, optional status code of the errors (default: 503)
+'seed' - int, optional seed for the random errors, to make runs repeatable
+"""
+
+
+class NullTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        seed: int = None,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+
+    def respond(self, request: httpx.Request) -> httpx.Response:
+        if self.error_rate and self._random.random() < self.error_rate:
+            return _json_response(
+                self.error_status, {"errors": [{"title": "Simulated error"}]}
+            )
+
+        key = endpoint_key(request.method, request.url.path)
+        if key == "POST messages":
+            return _json_response(
+                200, {"messages": [{"id": f"null-{next(self._ids)}"}]}
+            )
+        if key == "POST media":
+            return _json_response(200, {"media": [{"id": str(uuid.uuid4())}]})
+        if key == "GET contacts/*/profile":
+            return _json_response(
+                200, {"version": "null", "schema": "null", "fields": {}}
+            )
+        if key == "PATCH contacts/*/profile":
+            return _json_response(201, {"fields": json.loads(request.content or b"{}")})
+        if key == "GET contacts/*/claim":
+            return _json_response(404, {"errors": ["No conversation claim found"]})
+        if key == "DELETE contacts/*/claim":
+            return _json_response(200, json.loads(request.content or b"{}"))
+        if key == "POST stacks/*/start":
+            return _json_response(201, {"success": True})
+        return _json_response(404, {"errors": [{"title": "Not found"}]})
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            time.sleep(self.latency)
+        return self.respond(request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.respond(request)
+
+
+"""
+Pass requests on to another transport, by default the network, and record every
+exchange to a JSONL file for ReplayTransport.
+"""
+
+
+class RecordingTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    def __init__(self, file_name: str, transport=None):
+        self.file_name = file_name
+        self.transport = transport
+        self._owns_transport = transport is None
+        self._lock = threading.Lock()
+
+    def _record(self, request: httpx.Request, response: httpx.Response) -> None:
+        record = {
+            "endpoint": endpoint_key(request.method, request.url.path),
+            "status": response.status_code,
+            "body": response.content.decode(),
+        }
+        with self._lock, open(self.file_name, "a") as file:
+            file.write(json.dumps(record) + "\n")
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.transport is None:
+            self.transport = httpx.HTTPTransport(retries=3)
+        response = self.transport.handle_request(request)
+        response.read()
+        self._record(request, response)
+        return response
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.transport is None:
+            self.transport = httpx.AsyncHTTPTransport(retries=3)
+        response = await self.transport.handle_async_request(request)
+        await response.aread()
+        self._record(request, response)
+        return response
+
+    def close(self) -> None:
+        if self._owns_transport and self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    async def aclose(self) -> None:
+        if self._owns_transport and self.transport is not None:
+            await self.transport.aclose()
+            self.transport = None
+
+
+"""
+Serve the responses recorded by a RecordingTransport. Endpoints that were never
+recorded get a 404.
+"""
+
+
+class ReplayTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    def __init__(self, file_name: str):
+        recorded = {}
+        with open(file_name, "r") as file:
+            for line in file:
+                record = json.loads(line)
+                recorded.setdefault(record["endpoint"], []).append(
+                    (record["status"], record["body"].encode())
+                )
+        self._responses = {
+            endpoint: itertools.cycle(responses)
+            for endpoint, responses in recorded.items()
+        }
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        responses = self._responses.get(endpoint_key(request.method, request.url.path))
+        if responses is None:
+            return _json_response(404, {"errors": [{"title": "Not recorded"}]})
+        status_code, content = next(responses)
+        return httpx.Response(status_code, headers=_JSON_HEADERS, content=content)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return self.handle_request(request)
+
+
+"""
+Use an httpx transport from a requests session, for the sync client. It implements
+the send() and close() of a requests adapter, and imports requests only when used.
+"""
+
+
+class TransportAdapter:
+    def __init__(self, transport: httpx.BaseTransport):
+        self.transport = transport
+
+    def send(self, request, **kwargs):
+        from requests.models import Response
+        from requests.structures import CaseInsensitiveDict
+
+        body = request.body or b""
+        if isinstance(body, str):
+            body = body.encode()
+        transport_response = self.transport.handle_request(
+            httpx.Request(
+                request.method, request.url, headers=request.headers, content=body
+            )
+        )
+        transport_response.read()
+
+        response = Response()
+        response.status_code = transport_response.status_code
+        response.headers = CaseInsensitiveDict(transport_response.headers)
+        response._content = transport_response.content
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
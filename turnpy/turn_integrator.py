@@ -1,13 +1,171 @@
+from __future__ import annotations
+
 import json
 import logging
-from datetime import datetime
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
+
+from turnpy import core
+from turnpy.circuit_breaker import CircuitBreaker
+from turnpy.credentials import (
+    CredentialProvider,
+    FileCredentialProvider,
+    check_expiry,
+)
+from turnpy.exceptions import ClientClosedError
+from turnpy.messages import (
+    build_interactive_message,
+    build_media_message,
+    build_template_message,
+    build_text_message,
+)
+from turnpy.session_window import SessionWindowIndex, SessionWindowRouter
+from turnpy.validation import check_message
+
+if TYPE_CHECKING:
+    import requests
+
+"""
+The client holds the pooled HTTP session, the credential provider and the optional
+circuit breaker shared by all calls. With validate_payloads set, send_message checks
+every payload locally and raises a PayloadValidationError instead of sending an
+invalid one. Pass a transport from turnpy.transports to load test without sending
+anything to Turn. Replace the module level turn_client to use another provider or a
+circuit breaker, e.g.:
+turn_client = TurnClient(CachingCredentialProvider(EnvCredentialProvider()), CircuitBreaker())
+
+Use the client as a context manager, or call drain() and close() on shutdown, so
+in-flight sends are completed before the process exits. A drained client keeps
+rejecting requests, also after close(), until it is reopened.
+
+The session is shared by all threads, but never with a forked process: a child
+process, e.g. a gunicorn or celery prefork worker, drops the session and locks it
+inherited and transparently builds its own on first use.
+"""
+
+_turn_clients = weakref.WeakSet()
+
+
+class TurnClient:
+    def __init__(
+        self,
+        credential_provider: CredentialProvider = None,
+        circuit_breaker: CircuitBreaker = None,
+        validate_payloads: bool = False,
+        transport=None,
+    ):
+        self.credential_provider = credential_provider or FileCredentialProvider()
+        self.circuit_breaker = circuit_breaker
+        self.validate_payloads = validate_payloads
+        self.transport = transport
+        self._accepting = True
+        self._reset()
+        _turn_clients.add(self)
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._session = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._idle = threading.Condition()
+
+    def _build_session(self) -> requests.Session:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        if self.transport is not None:
+            from turnpy.transports import TransportAdapter
+
+            session.mount("https://", TransportAdapter(self.transport))
+        else:
+            session.mount(
+                "https://",
+                HTTPAdapter(pool_connections=10, pool_maxsize=100, max_retries=3),
+            )
+        return session
+
+    def get_session(self) -> requests.Session:
+        if self._pid != os.getpid():
+            self._reset()
+
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._build_session()
+        return self._session
+
+    def close(self):
+        if self._session:
+            self._session.close()
+            self._session = None
+
+    """
+    Accept requests again after a drain. Entering the client as a context manager
+    reopens it, so the module level turn_client can be used for more than one run.
+    """
+
+    def reopen(self) -> None:
+        with self._idle:
+            self._accepting = True
+
+    def __enter__(self):
+        self.reopen()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.drain()
+        self.close()
+
+    def _start_request(self) -> None:
+        with self._idle:
+            if not self._accepting:
+                raise ClientClosedError("The Turn client is draining for shutdown.")
+            self._in_flight += 1
+
+    def _finish_request(self) -> None:
+        with self._idle:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self._idle.notify_all()
+
+    """
+    Prepare for shutdown, e.g. on SIGTERM during a deploy.
+
+    The client stops accepting new requests, raising ClientClosedError, and waits for
+    the requests in flight on other threads. Returns a report with the number of
+    requests still 'in_flight' when the timeout ran out.
+    """
+
+    def drain(self, timeout: float = 30.0) -> dict:
+        with self._idle:
+            self._accepting = False
+            self._idle.wait_for(lambda: self._in_flight == 0, timeout)
+            report = {"in_flight": self._in_flight, "unflushed": 0}
+
+        if report["in_flight"]:
+            logger.warning(f"Turn client drained with incomplete work: {report}")
+        return report
+
+
+def _reset_after_fork() -> None:
+    for client in list(_turn_clients):
+        client._reset()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+turn_client = TurnClient()
 
-import requests
-from requests.auth import HTTPBasicAuth
 
 """SETUP"""
 """
-Load and evaluate the credentials from the turn_config.json file.
+Load and evaluate the credentials from the credential provider of the turn_client,
+by default the turn_config.json file.
 """
 
 logger = logging.getLogger(__name__)
@@ -26,20 +184,41 @@ Determine if the Turn credentials are still valid.
 
 
 def eval_credentials(config_json: json) -> str:
-    with open("turn_config.json", "r") as file:
-        turn_config = json.load(file)
-
-    token_expiry = datetime.strptime(config_json["expiry"], "%b %d, %Y %I:%M %p")
-    if token_expiry > datetime.now():
-        return config_json["token"]
-    else:
-        raise ValueError("API key has expired for this Turn line.")
+    return check_expiry(config_json)
 
 
 def turn_credentials(line_name):
-    config_json = load_credentials("turn_config.json", line_name)
+    return turn_client.credential_provider.token(line_name)
 
-    return eval_credentials(config_json)
+
+"""
+Send a request built by turnpy.core through the pooled session of the turn_client.
+
+The request is tracked as in flight on the turn_client, which rejects it with a
+ClientClosedError while draining. If the turn_client has a circuit breaker, it is keyed
+by the line name and endpoint of the request, and raises a CircuitOpenError without
+sending while Turn is failing.
+"""
+
+
+def _request(turn_request: core.TurnRequest) -> requests.Response:
+    owner = turn_client
+    owner._start_request()
+    try:
+        session = owner.get_session()
+        url = f"{core.BASE_URL}/{turn_request.path}"
+        kwargs = {"headers": turn_request.headers, "data": turn_request.body}
+
+        import requests
+
+        with core.CircuitOutcome(
+            owner.circuit_breaker, turn_request, requests.RequestException
+        ) as outcome:
+            response = session.request(turn_request.method, url, **kwargs)
+            outcome.response(response.status_code)
+        return response
+    finally:
+        owner._finish_request()
 
 
 """CONTACTS"""
@@ -52,13 +231,10 @@ https://whatsapp.turn.io/docs/api/contacts#retrieve-a-contact-profile
 
 
 def obtain_contact_profile(msisdn: str, line_name: str) -> requests.Response:
-    auth_headers = {
-        "Authorization": f"Bearer {turn_credentials(line_name)}",
-        "Accept": "application/vnd.v1+json",
-    }
-
-    response = requests.get(
-        f"https://whatsapp.turn.io/v1/contacts/{msisdn}/profile", headers=auth_headers
+    response = _request(
+        core.obtain_contact_profile_request(
+            msisdn, line_name, turn_credentials(line_name)
+        )
     )
     logging.debug(f"Obtained contact profile response: {response.text}")
     return response
@@ -74,15 +250,10 @@ https://whatsapp.turn.io/docs/api/contacts#update-a-contact-profile
 def update_contact_profile(
     msisdn: str, line_name: str, profile_data: json
 ) -> requests.Response:
-    auth_headers = {
-        "Authorization": f"Bearer {turn_credentials(line_name)}",
-        "Accept": "application/vnd.v1+json",
-    }
-
-    response = requests.patch(
-        f"https://whatsapp.turn.io/v1/contacts/{msisdn}/profile",
-        headers=auth_headers,
-        json=profile_data,
+    response = _request(
+        core.update_contact_profile_request(
+            msisdn, line_name, turn_credentials(line_name), profile_data
+        )
     )
     logger.debug(f"Updated contact profile response: {response.text}")
     return response
@@ -97,10 +268,11 @@ See documentation here: https://whatsapp.turn.io/docs/api/messages
 
 
 def send_message(line_name: str, message_data: json) -> requests.Response:
-    auth_headers = {"Authorization": f"Bearer {turn_credentials(line_name)}"}
+    if turn_client.validate_payloads and not isinstance(message_data, bytes):
+        check_message(message_data)
 
-    return requests.post(
-        "https://whatsapp.turn.io/v1/messages", headers=auth_headers, json=message_data
+    return _request(
+        core.send_message_request(line_name, turn_credentials(line_name), message_data)
     )
 
 
@@ -113,13 +285,7 @@ another type of recipient.
 
 
 def send_text_message(msisdn: str, line_name: str, message: str) -> requests.Response:
-    message_data = {
-        "preview_url": False,
-        "recipient_type": "individual",
-        "to": f"{msisdn}",
-        "type": "text",
-        "text": {"body": message},
-    }
+    message_data = build_text_message(msisdn, message)
 
     response = send_message(line_name, message_data)
     logger.debug("Sent text message response", response.text)
@@ -134,32 +300,7 @@ def send_media_message(
     caption="",
     message: str = "",
 ) -> requests.Response:
-    message_data = {
-        "to": msisdn,
-        "recipient_type": "individual",
-    }
-    if media_type == "audio":
-        message_data["type"] = "audio"
-        message_data["audio"] = {"id": media_id}
-
-    elif media_type == "document":
-        message_data["type"] = "document"
-        message_data["document"] = {"id": media_id, "caption": caption}
-
-    elif media_type == "image":
-        message_data["type"] = "image"
-        message_data["image"] = {"id": media_id, "caption": caption}
-
-    elif media_type == "sticker":
-        message_data["type"] = "sticket"
-        message_data["sticket"] = {"id": media_id}
-
-    elif media_type == "video":
-        message_data["type"] = "video"
-        message_data["video"] = {"id": media_id, "caption": caption}
-
-    if message:
-        message_data["text"] = {"body": message}
+    message_data = build_media_message(msisdn, media_type, media_id, caption, message)
 
     response = send_message(line_name, message_data)
     logger.debug(f"Sent media message response: {response.text}")
@@ -185,52 +326,7 @@ https://whatsapp.turn.io/docs/api/messages#interactive-messages
 def send_interactive_message(
     msisdn: str, line_name: str, interactive_type: str, sections: json
 ) -> requests.Response:
-    message_data = {
-        "to": msisdn,
-        "type": "interactive",
-        "interactive": {
-            "type": interactive_type,
-            "body": {"text": sections["body_text"]},
-            "action": {},
-        },
-    }
-
-    if sections["header_text"]:
-        message_data["interactive"]["header"] = {
-            "type": "text",
-            "text": sections["header_text"],
-        }
-    elif sections["header_image"]:
-        message_data["interactive"]["header"] = {
-            "type": "image",
-            "id": sections["header_image"],
-        }
-
-    if sections["footer_text"]:
-        message_data["interactive"]["footer"] = {"text": sections["footer_text"]}
-
-    if interactive_type == "button":
-        message_data["interactive"]["action"]["buttons"] = []
-        for button in sections["buttons"]:
-            message_data["interactive"]["action"]["buttons"].append(
-                {
-                    "type": "reply",
-                    "reply": {"id": button["callback_id"], "title": button["text"]},
-                }
-            )
-
-    if interactive_type == "list":
-        message_data["interactive"]["action"]["button"] = sections["list_button"]
-        message_data["interactive"]["action"]["sections"] = []
-        message_data["interactive"]["action"]["sections"].append({})
-        message_data["interactive"]["action"]["sections"][0]["title"] = sections[
-            "list_title"
-        ]
-        message_data["interactive"]["action"]["sections"][0]["rows"] = []
-        for list_item in sections["list_items"]:
-            message_data["interactive"]["action"]["sections"][0]["rows"].append(
-                {"id": list_item["callback_id"], "title": list_item["text"]}
-            )
+    message_data = build_interactive_message(msisdn, interactive_type, sections)
 
     response = send_message(line_name, message_data)
     logger.debug(f"Sent interactive message response: {response.text}")
@@ -247,12 +343,10 @@ https://whatsapp.turn.io/docs/api/media#supported-file-types
 
 
 def save_media(line_name: str, type: str, file_binary: str) -> requests.Response:
-    auth_headers = {
-        "Authorization": f"Bearer {turn_credentials(line_name)}",
-        "Content-Type": type,
-    }
-    response = requests.post(
-        "https://whatsapp.turn.io/v1/media", headers=auth_headers, data=file_binary
+    response = _request(
+        core.save_media_request(
+            line_name, turn_credentials(line_name), type, file_binary
+        )
     )
     logger.debug(f"Saved media response: {response.text}")
     return response
@@ -276,6 +370,11 @@ https://whatsapp.turn.io/docs/api/messages#template-messages
 """
 
 
+def template_namespace(line_name: str) -> str:
+    config_json = turn_client.credential_provider.line_config(line_name)
+    return config_json["template_namespace"]
+
+
 def send_template_message(
     msisdn: str,
     line_name: str,
@@ -285,35 +384,14 @@ def send_template_message(
     language: str = "en",
 ) -> requests.Response:
 
-    # Get credentials and config
-    config_json = load_credentials("turn_config.json", line_name)
-    template_namespace = config_json["template_namespace"]
-
-    # Build the message data
-    message_data = {
-        "to": msisdn,
-        "type": "template",
-        "template": {
-            "namespace": template_namespace,
-            "name": template_name,
-            "language": {"code": language, "policy": "deterministic"},
-            "components": [],
-        },
-    }
-
-    if header_params:
-        header_component = {
-            "type": "header",
-            "parameters": [{"type": "text", "text": param} for param in header_params],
-        }
-        message_data["template"]["components"].append(header_component)
-
-    if body_params:
-        body_component = {
-            "type": "body",
-            "parameters": [{"type": "text", "text": param} for param in body_params],
-        }
-        message_data["template"]["components"].append(body_component)
+    message_data = build_template_message(
+        msisdn,
+        template_namespace(line_name),
+        template_name,
+        header_params,
+        body_params,
+        language,
+    )
 
     response = send_message(line_name, message_data)
     logger.debug(f"Send a template message: {response.text}")
@@ -330,28 +408,18 @@ See: https://whatsapp.turn.io/docs/api/extensions#managing-conversation-claims
 
 
 def determine_claim(msisdn: str, line_name: str) -> requests.Response:
-    auth_headers = {
-        "Authorization": f"Bearer {turn_credentials(line_name)}",
-        "Accept": "application/vnd.v1+json",
-    }
-    response = requests.get(
-        f"https://whatsapp.turn.io/v1/contacts/{msisdn}/claim", headers=auth_headers
+    response = _request(
+        core.determine_claim_request(msisdn, line_name, turn_credentials(line_name))
     )
     logger.debug(f"Determined claim response: {response.text}")
     return response
 
 
 def release_claim(msisdn: str, line_name: str, claim_uuid: str) -> requests.Response:
-    claim_data = {"claim_uuid": claim_uuid}
-
-    auth_headers = {
-        "Authorization": f"Bearer {turn_credentials(line_name)}",
-        "Accept": "application/vnd.v1+json",
-    }
-    response = requests.delete(
-        f"https://whatsapp.turn.io/v1/contacts/{msisdn}/claim",
-        headers=auth_headers,
-        json=claim_data,
+    response = _request(
+        core.release_claim_request(
+            msisdn, line_name, turn_credentials(line_name), claim_uuid
+        )
     )
     logger.debug(f"Released claim response: {response.text}")
     return response
@@ -366,16 +434,242 @@ Details here: https://whatsapp.turn.io/docs/api/stacks
 
 
 def start_journey(msisdn: str, line_name: str, stack_uuid: str) -> requests.Response:
-    journey_data = {"wa_id": msisdn}
-
-    auth_headers = {
-        "Authorization": f"Bearer {turn_credentials(line_name)}",
-        "Accept": "application/vnd.v1+json",
-    }
-    response = requests.post(
-        f"https://whatsapp.turn.io/v1/stacks/{stack_uuid}/start",
-        headers=auth_headers,
-        json=journey_data,
+    response = _request(
+        core.start_journey_request(
+            msisdn, line_name, turn_credentials(line_name), stack_uuid
+        )
     )
     logger.debug(f"Started journey response: {response.text}")
     return response
+
+
+"""BULK"""
+"""
+Retry a request that Turn rejected with 429 Too Many Requests.
+
+The wait between attempts follows the Retry-After header of the response, falling
+back to one second. After 'retries' attempts the last 429 response is returned.
+"""
+
+RATE_LIMIT_RETRIES = 3
+
+
+def _respect_rate_limit(
+    request: Callable[[], requests.Response], retries: int = RATE_LIMIT_RETRIES
+) -> requests.Response:
+    response = request()
+    for _ in range(retries):
+        if response.status_code != 429:
+            break
+        delay = core.retry_after(response.headers)
+        logger.warning(f"Rate limited by Turn, retrying in {delay} seconds")
+        time.sleep(delay)
+        response = request()
+    return response
+
+
+"""
+Run a function for every item of an iterable on a pool of threads.
+
+Items are only pulled from the iterable when a thread frees up and the caller asks
+for the next outcome, so a lazy iterable such as the readers in turnpy.recipients is
+consumed at the pace of the network and memory stays constant. Outcomes are yielded
+as (item, result) pairs in completion order, where the result is either the return
+value of the worker or the exception it raised.
+"""
+
+
+def _run_bulk(items: Iterable, worker: Callable, concurrency: int) -> Iterator[tuple]:
+    if concurrency < 1:
+        raise ValueError("Bulk concurrency must be at least 1.")
+
+    iterator = iter(items)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        try:
+            while True:
+                for item in iterator:
+                    pending[executor.submit(worker, item)] = item
+                    if len(pending) >= concurrency:
+                        break
+                if not pending:
+                    return
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    if future.exception() is not None:
+                        yield item, future.exception()
+                    else:
+                        yield item, future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+"""
+Send a templated message to every recipient of a cohort.
+
+The arguments are:
+'line_name' - string, required Turn line to use
+'template_name' - string, required name of the template to use
+'recipients' - iterable, required dictionaries with an 'msisdn' and optional
+'header_params' and 'body_params' lists, e.g. from turnpy.recipients.read_recipients
+'language' - string, optional language code for the template (default: 'en')
+'concurrency' - int, optional maximum number of requests in flight (default: 10)
+
+The template namespace is loaded once for the whole run. Yields (msisdn, response)
+pairs as sends complete; a failed send yields the exception instead of a response.
+"""
+
+
+def send_template_message_bulk(
+    line_name: str,
+    template_name: str,
+    recipients: Iterable[dict],
+    language: str = "en",
+    concurrency: int = 10,
+) -> Iterator[tuple]:
+    namespace = template_namespace(line_name)
+
+    def send(recipient):
+        message_data = build_template_message(
+            recipient["msisdn"],
+            namespace,
+            template_name,
+            recipient.get("header_params"),
+            recipient.get("body_params"),
+            language,
+        )
+        return _respect_rate_limit(lambda: send_message(line_name, message_data))
+
+    for recipient, outcome in _run_bulk(recipients, send, concurrency):
+        logger.debug(f"Bulk template message to {recipient['msisdn']}: {outcome}")
+        yield recipient["msisdn"], outcome
+
+
+"""
+Send free-form messages, e.g. built with turnpy.messages, to many contacts.
+
+The arguments are:
+'line_name' - string, required Turn line to use
+'messages' - iterable, required message payloads
+'concurrency' - int, optional maximum number of requests in flight (default: 10)
+'session_windows' - SessionWindowIndex, optional index of the conversation windows of
+the contacts, from turnpy.session_window
+'fallback_template' - string, optional template to send to contacts outside their
+window instead, once per contact; without one they are skipped
+'language' - string, optional language code for the fallback template (default: 'en')
+'fallback_header_params' - list, optional header parameters of the fallback template
+'fallback_body_params' - list, optional body parameters of the fallback template
+
+Contacts outside their window are handled locally, without a request to Turn. Yields
+(msisdn, response) pairs as sends complete; a failed send yields the exception instead
+of a response, and a skipped message a SessionWindowClosedError.
+"""
+
+
+def send_message_bulk(
+    line_name: str,
+    messages: Iterable[dict],
+    concurrency: int = 10,
+    session_windows: SessionWindowIndex = None,
+    fallback_template: str = None,
+    language: str = "en",
+    fallback_header_params: list = None,
+    fallback_body_params: list = None,
+) -> Iterator[tuple]:
+    router = SessionWindowRouter(
+        session_windows,
+        fallback_template,
+        template_namespace(line_name) if fallback_template else None,
+        fallback_header_params,
+        fallback_body_params,
+        language,
+    )
+
+    def send(message_data):
+        message_data = router.route(message_data)
+        return _respect_rate_limit(lambda: send_message(line_name, message_data))
+
+    for message_data, outcome in _run_bulk(messages, send, concurrency):
+        logger.debug(f"Bulk message to {message_data['to']}: {outcome}")
+        yield message_data["to"], outcome
+
+
+"""
+Start a journey for every msisdn of a cohort, e.g. to enrol a whole class in a Stack.
+
+The token is read for every contact, so a token rotated during a long run is picked
+up, while the auth headers are cached per token and the requests share the pooled
+session of the client. Yields (msisdn, response) pairs as journeys are started;
+a failed request yields the exception instead of a response.
+"""
+
+
+def start_journey_bulk(
+    stack_uuid: str,
+    msisdns: Iterable[str],
+    line_name: str,
+    concurrency: int = 10,
+) -> Iterator[tuple]:
+    def start(msisdn):
+        token = turn_credentials(line_name)
+        turn_request = core.start_journey_request(msisdn, line_name, token, stack_uuid)
+        return _respect_rate_limit(lambda: _request(turn_request))
+
+    for msisdn, outcome in _run_bulk(msisdns, start, concurrency):
+        logger.debug(f"Bulk started journey for {msisdn}: {outcome}")
+        yield msisdn, outcome
+
+
+"""
+Determine and release the claims on many contacts, e.g. to clean up after a broken Journey.
+
+The arguments are:
+'msisdns' - iterable, required contacts to release
+'line_name' - string, required Turn line to use
+'claim_uuid_prefix' - string, optional only release claims whose uuid starts with
+this, pass a full uuid to release a single claim
+'concurrency' - int, optional maximum number of contacts in flight (default: 10)
+
+Each contact's claim is determined and released in one pipelined step over pooled
+connections. The token is read for every contact, so a rotated token is picked up. Returns a summary with the msisdns that were
+'released', 'skipped' because the claim did not match, 'unclaimed', or that 'failed'.
+"""
+
+
+def release_claims_bulk(
+    msisdns: Iterable[str],
+    line_name: str,
+    claim_uuid_prefix: str = None,
+    concurrency: int = 10,
+) -> dict:
+    def release(msisdn):
+        token = turn_credentials(line_name)
+        determine = core.determine_claim_request(msisdn, line_name, token)
+        response = _respect_rate_limit(lambda: _request(determine))
+        outcome, claim_uuid = core.parse_claim(
+            response.status_code, response.content, claim_uuid_prefix
+        )
+        if outcome != "release":
+            return outcome
+
+        release_request = core.release_claim_request(
+            msisdn, line_name, token, claim_uuid
+        )
+        response = _respect_rate_limit(lambda: _request(release_request))
+        return "released" if response.status_code == 200 else "failed"
+
+    summary = {"released": [], "skipped": [], "unclaimed": [], "failed": []}
+    for msisdn, outcome in _run_bulk(msisdns, release, concurrency):
+        if isinstance(outcome, Exception):
+            logger.warning(f"Failed to release claim for {msisdn}: {outcome}")
+            outcome = "failed"
+        summary[outcome].append(msisdn)
+
+    logger.info(
+        "Released claims: "
+        + ", ".join(f"{len(done)} {outcome}" for outcome, done in summary.items())
+    )
+    return summary
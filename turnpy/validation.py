@@ -0,0 +1,247 @@
+import re
+from typing import Iterable
+
+"""VALIDATION"""
+"""
+Validate message payloads locally, before they cost a round trip and API quota.
+
+Each message type has its own check, looked up once per payload from a table built at
+import time, against the limits WhatsApp applies to the messages Turn sends on:
+https://developers.facebook.com/docs/whatsapp/cloud-api/reference/messages
+
+Validate single payloads with validate_message() or check_message(), or dry-run a whole
+campaign with validate_campaign() before the first request goes out. Set
+validate_payloads on a Turn client to check every payload in send_message.
+Malformed payloads, e.g. a string where an object is expected, are reported as errors
+too, rather than raised.
+"""
+
+MSISDN_PATTERN = re.compile(r"^\+?[1-9][0-9]{7,14}$")
+
+MAX_TEXT_BODY = 4096
+MAX_CAPTION = 1024
+MAX_INTERACTIVE_BODY = 1024
+MAX_HEADER_TEXT = 60
+MAX_FOOTER_TEXT = 60
+MAX_BUTTONS = 3
+MAX_BUTTON_TITLE = 20
+MAX_BUTTON_ID = 256
+MAX_LIST_BUTTON = 20
+MAX_LIST_ROWS = 10
+MAX_ROW_TITLE = 24
+MAX_ROW_ID = 200
+MAX_SECTION_TITLE = 24
+
+
+class PayloadValidationError(ValueError):
+    def __init__(self, errors: list):
+        self.errors = errors
+        super().__init__("Invalid message payload: " + "; ".join(errors))
+
+
+def _check_text(errors: list, name: str, value, maximum: int, required=True) -> None:
+    if value is None or value == "":
+        if required:
+            errors.append(f"{name} is required")
+    elif not isinstance(value, str):
+        errors.append(f"{name} must be a string")
+    elif len(value) > maximum:
+        errors.append(f"{name} is longer than {maximum} characters")
+
+
+def _object(errors: list, name: str, value) -> dict:
+    if isinstance(value, dict):
+        return value
+    if value is not None:
+        errors.append(f"{name} must be an object")
+    return {}
+
+
+def _array(errors: list, name: str, value) -> list:
+    if isinstance(value, list):
+        return value
+    if value is not None:
+        errors.append(f"{name} must be a list")
+    return []
+
+
+def _validate_text(message_data: dict, errors: list) -> None:
+    text = _object(errors, "text", message_data.get("text"))
+    _check_text(errors, "text body", text.get("body"), MAX_TEXT_BODY)
+
+
+def _validate_media(message_data: dict, errors: list) -> None:
+    media_type = message_data["type"]
+    media = _object(errors, media_type, message_data.get(media_type))
+    if not media.get("id"):
+        errors.append(f"{media_type} id is required")
+    _check_text(errors, "caption", media.get("caption"), MAX_CAPTION, required=False)
+
+
+def _validate_buttons(action: dict, errors: list) -> None:
+    buttons = _array(errors, "buttons", action.get("buttons"))
+    if not 1 <= len(buttons) <= MAX_BUTTONS:
+        errors.append(f"button messages need 1 to {MAX_BUTTONS} buttons")
+
+    ids = set()
+    for number, button in enumerate(buttons, start=1):
+        if not isinstance(button, dict):
+            errors.append(f"button {number} must be an object")
+            continue
+        reply = _object(errors, f"button {number} reply", button.get("reply"))
+        _check_text(
+            errors, f"button {number} title", reply.get("title"), MAX_BUTTON_TITLE
+        )
+        _check_text(errors, f"button {number} id", reply.get("id"), MAX_BUTTON_ID)
+        if reply.get("id") in ids:
+            errors.append(f"button {number} id is not unique")
+        ids.add(reply.get("id"))
+
+
+def _validate_list(action: dict, errors: list) -> None:
+    _check_text(errors, "list button", action.get("button"), MAX_LIST_BUTTON)
+
+    sections = [
+        _object(errors, f"list section {number}", section)
+        for number, section in enumerate(
+            _array(errors, "list sections", action.get("sections")), start=1
+        )
+    ]
+    rows = [
+        row
+        for section in sections
+        for row in _array(errors, "list rows", section.get("rows"))
+    ]
+    if not 1 <= len(rows) <= MAX_LIST_ROWS:
+        errors.append(f"list messages need 1 to {MAX_LIST_ROWS} rows")
+
+    for section in sections:
+        _check_text(
+            errors,
+            "list title",
+            section.get("title"),
+            MAX_SECTION_TITLE,
+            required=False,
+        )
+    ids = set()
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append(f"list item {number} must be an object")
+            continue
+        _check_text(
+            errors, f"list item {number} title", row.get("title"), MAX_ROW_TITLE
+        )
+        _check_text(errors, f"list item {number} id", row.get("id"), MAX_ROW_ID)
+        if row.get("id") in ids:
+            errors.append(f"list item {number} id is not unique")
+        ids.add(row.get("id"))
+
+
+_INTERACTIVE_VALIDATORS = {"button": _validate_buttons, "list": _validate_list}
+
+
+def _validate_interactive(message_data: dict, errors: list) -> None:
+    interactive = _object(errors, "interactive", message_data.get("interactive"))
+    body = _object(errors, "body", interactive.get("body"))
+    _check_text(errors, "body text", body.get("text"), MAX_INTERACTIVE_BODY)
+
+    header = _object(errors, "header", interactive.get("header"))
+    if header and header.get("type") == "text":
+        _check_text(errors, "header text", header.get("text"), MAX_HEADER_TEXT)
+    elif header and not header.get("id"):
+        errors.append("header image id is required")
+    if "footer" in interactive:
+        footer = _object(errors, "footer", interactive["footer"])
+        _check_text(errors, "footer text", footer.get("text"), MAX_FOOTER_TEXT)
+
+    validator = _INTERACTIVE_VALIDATORS.get(interactive.get("type"))
+    if validator is None:
+        errors.append(f"unknown interactive type {interactive.get('type')!r}")
+    else:
+        validator(_object(errors, "action", interactive.get("action")), errors)
+
+
+def _validate_template(message_data: dict, errors: list) -> None:
+    template = _object(errors, "template", message_data.get("template"))
+    if not template.get("namespace"):
+        errors.append("template namespace is required")
+    if not template.get("name"):
+        errors.append("template name is required")
+    components = _array(errors, "template components", template.get("components"))
+    for number, component in enumerate(components, start=1):
+        if not isinstance(component, dict):
+            errors.append(f"template component {number} must be an object")
+            continue
+        if not component.get("type"):
+            errors.append(f"template component {number} type is required")
+        name = component.get("type") or f"component {number}"
+        parameters = _array(errors, f"{name} parameters", component.get("parameters"))
+        for position, parameter in enumerate(parameters, start=1):
+            if not isinstance(parameter, dict):
+                errors.append(f"{name} parameter {position} must be an object")
+                continue
+            if parameter.get("type") == "text" and not parameter.get("text"):
+                errors.append(f"{name} parameter {position} is empty")
+
+
+_VALIDATORS = {
+    "text": _validate_text,
+    "audio": _validate_media,
+    "document": _validate_media,
+    "image": _validate_media,
+    "sticker": _validate_media,
+    "video": _validate_media,
+    "interactive": _validate_interactive,
+    "template": _validate_template,
+}
+
+
+"""
+Return the list of problems with a message payload, empty if it is valid.
+"""
+
+
+def validate_message(message_data: dict) -> list:
+    if not isinstance(message_data, dict):
+        return ["message payload must be an object"]
+
+    errors = []
+    if not MSISDN_PATTERN.match(str(message_data.get("to", ""))):
+        errors.append(f"recipient {message_data.get('to')!r} is not a valid msisdn")
+
+    validator = _VALIDATORS.get(message_data.get("type"))
+    if validator is None:
+        errors.append(f"unknown message type {message_data.get('type')!r}")
+    else:
+        validator(message_data, errors)
+    return errors
+
+
+def check_message(message_data: dict) -> None:
+    errors = validate_message(message_data)
+    if errors:
+        raise PayloadValidationError(errors)
+
+
+"""
+Dry-run a campaign: validate every payload without sending anything.
+
+Returns a report with the number of 'valid' payloads and, for each 'invalid' one, its
+index in the campaign, its recipient and its problems.
+"""
+
+
+def validate_campaign(messages: Iterable[dict]) -> dict:
+    report = {"valid": 0, "invalid": []}
+    for index, message_data in enumerate(messages):
+        errors = validate_message(message_data)
+        if errors:
+            recipient = (
+                message_data.get("to") if isinstance(message_data, dict) else None
+            )
+            report["invalid"].append(
+                {"index": index, "to": recipient, "errors": errors}
+            )
+        else:
+            report["valid"] += 1
+    return report